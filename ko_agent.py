@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import os
+import subprocess
+import sys
+
+from ko_dispatch import DEFAULT_AGENT_PORT, build_argv, resolve_os_key
+from ko_remote import encode_frame, read_frame, set_nodelay
+from ko_supervisor import install_child_watcher
+
+# Nimmt Befehle vom KO2 MIDI Commander entgegen (Einträge mit target, siehe ko_remote.py) und
+# startet sie auf diesem Rechner. Ohne token nur auf localhost erreichbar.
+KILL_GRACE = 2.0
+
+
+class Agent:
+    def __init__(self, token=None, os_key=None):
+        self.token = token
+        self.os_key = resolve_os_key() if os_key is None else os_key
+        self.clients = 0
+        self.started = 0
+        self.failed = 0
+        self._tasks = set()
+
+    async def handle(self, reader, writer):
+        set_nodelay(writer)
+        peer = writer.get_extra_info("peername")
+        try:
+            hello = await asyncio.wait_for(read_frame(reader), 5.0)
+            if not isinstance(hello, dict):
+                self._reply(writer, {"error": "Begrüßung muss ein JSON-Objekt sein"})
+                print(f"Abgelehnt: {peer} (ungültige Begrüßung)")
+                return
+            if self.token is not None and not hmac.compare_digest(str(hello.get("token") or ""), self.token):
+                writer.write(encode_frame({"error": "falsches Token"}))
+                print(f"Abgelehnt: {peer} (falsches Token)")
+                return
+            writer.write(encode_frame({"os": self.os_key}))
+            self.clients += 1
+            print(f"🔗 Verbunden: {peer}")
+            while True:
+                request = await read_frame(reader)
+                if not isinstance(request, dict):
+                    self._reply(writer, {"error": "Anfrage muss ein JSON-Objekt sein"})
+                    continue
+                task = asyncio.get_running_loop().create_task(self._run(request, writer))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _run(self, request, writer):
+        # Jeder Befehl läuft für sich; Antworten gehen zurück, sobald sie feststehen.
+        rid = request.get("id")
+        command = request.get("cmd")
+        if not isinstance(command, str) or not command:
+            # Fehlerhafte Anfrage: beantworten statt die Verbindung abzubrechen.
+            self.failed += 1
+            self._reply(writer, {"id": rid, "error": "Feld 'cmd' fehlt"})
+            return
+        argv, shell = build_argv(command, self.os_key)
+        try:
+            if shell:
+                proc = await asyncio.create_subprocess_shell(argv, stdin=subprocess.DEVNULL)
+            else:
+                proc = await asyncio.create_subprocess_exec(*argv, stdin=subprocess.DEVNULL)
+        except OSError as e:
+            self.failed += 1
+            self._reply(writer, {"id": rid, "error": str(e)})
+            return
+        self.started += 1
+        self._reply(writer, {"id": rid, "pid": proc.pid})
+        try:
+            rc = await asyncio.wait_for(proc.wait(), request.get("timeout"))
+        except asyncio.TimeoutError:
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), KILL_GRACE)
+            except asyncio.TimeoutError:
+                proc.kill()
+            self._reply(writer, {"id": rid, "error": f"Zeitüberschreitung nach {request['timeout']}s"})
+            return
+        self._reply(writer, {"id": rid, "rc": rc})
+
+    @staticmethod
+    def _reply(writer, message):
+        # Die Verbindung kann inzwischen weg sein; der Befehl läuft trotzdem zu Ende.
+        if not writer.is_closing():
+            writer.write(encode_frame(message))
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+async def serve(host, port, token):
+    agent = Agent(token)
+    server = await asyncio.start_server(agent.handle, host, port)
+    names = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+    print(f"👂 Agent bereit auf {names} ({agent.os_key})", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Führt Befehle für den KO2 MIDI Commander aus")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Adresse, auf der gelauscht wird (Standard: nur localhost)")
+    parser.add_argument("--port", type=int, default=DEFAULT_AGENT_PORT)
+    parser.add_argument("--token", default=os.environ.get("KO2_AGENT_TOKEN"),
+                        help="gemeinsames Geheimnis mit dem Commander (auch über KO2_AGENT_TOKEN)")
+    args = parser.parse_args(argv)
+    if args.token is None and not _is_loopback(args.host):
+        parser.error("ohne --token nur auf localhost, sonst könnte jeder im Netz Befehle starten")
+    install_child_watcher()
+    try:
+        asyncio.run(serve(args.host, args.port, args.token))
+    except KeyboardInterrupt:
+        print("\n👋 Beendet.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
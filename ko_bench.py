@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextlib
+import heapq
+import os
+import resource
+import sys
+import threading
+import time
+
+import mido
+
+from ko_dispatch import compile_mapping
+from ko_engine import Engine
+from ko_latency import PERCENTILES, format_ns
+from ko_log import EventLog
+from ko_mapping import load_mapping
+from ko_supervisor import Supervisor, install_child_watcher
+
+# Benchmark für den Dispatch-Pfad ohne angeschlossenes KO II:
+#   python ko_bench.py --note-rate 2000 --clock-rate 48 --duration 5
+#   python ko_bench.py --backend true --note-rate 200
+# Rohdatenpfad (ko_raw.py) statt mido-Nachrichten, bzw. beide nacheinander:
+#   python ko_bench.py --raw --note-rate 20000
+#   python ko_bench.py --compare --note-rate 20000
+# Verglichen wird nur, wenn beide Läufe gleich viel verworfen haben; bei "so schnell wie
+# möglich" (--note-rate -1) läuft der schnellere Erzeuger des Rohdatenpfads eher über.
+# Mit --max-p99-us schlägt der Lauf fehl, wenn die p99-Latenz den Grenzwert überschreitet.
+# Startzeit bis zur Bereitschaft (Kaltstart von ko.py, N Läufe):
+#   python ko_bench.py --startup 10 [--startup-port "KO II"] [--max-startup-ms 80]
+
+KO_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ko.py")
+READY_MARKER = "👂 Bereit"
+
+
+class SyntheticInput:
+    # Ersatz für mido.open_input(name, callback=...): ein Thread erzeugt Nachrichten mit
+    # festen Raten und ruft den Callback so auf wie das rtmidi-Backend. Mit raw bekommt der
+    # Callback wie bei ko_ports.RtMidiInput(raw=True) nur die Bytes.
+    def __init__(self, name, callback=None, notes=(), note_rate=1000.0, clock_rate=0.0,
+                 note_off=True, duration=1.0, count=None, raw=False):
+        self.name = name
+        self.callback = callback
+        self.notes = tuple(notes) or (60,)
+        self.note_rate = note_rate
+        self.clock_rate = clock_rate
+        self.note_off = note_off
+        self.duration = duration
+        self.count = count
+        self.raw = raw
+        self.sent = 0
+        self.done = threading.Event()
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="synthetic-midi", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._stop = True
+        self._thread.join()
+
+    def _streams(self):
+        index = 0
+
+        def note_on():
+            nonlocal index
+            note = self.notes[index % len(self.notes)]
+            index += 1
+            if self.raw:
+                return [[0x90, note, 100]] + ([[0x80, note, 0]] if self.note_off else [])
+            return [mido.Message('note_on', note=note, velocity=100)] + (
+                [mido.Message('note_off', note=note, velocity=0)] if self.note_off else [])
+
+        def clock():
+            return [[0xF8]] if self.raw else [mido.Message('clock')]
+
+        streams = []
+        if self.note_rate:
+            streams.append((1.0 / self.note_rate if self.note_rate > 0 else 0.0, note_on))
+        if self.clock_rate:
+            streams.append((1.0 / self.clock_rate, clock))
+        return streams
+
+    def _run(self):
+        callback = self.callback
+        streams = self._streams()
+        start = time.perf_counter()
+        end = start + self.duration
+        # Heap mit dem nächsten Fälligkeitszeitpunkt je Strom; Rate < 0 heißt "so schnell wie möglich".
+        heap = [(start, i) for i in range(len(streams))]
+        heapq.heapify(heap)
+        try:
+            while heap and not self._stop:
+                due, i = heapq.heappop(heap)
+                if due >= end or time.perf_counter() >= end or (
+                        self.count is not None and self.sent >= self.count):
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                interval, factory = streams[i]
+                for msg in factory():
+                    callback(msg)
+                    self.sent += 1
+                heapq.heappush(heap, (due + interval, i))
+        finally:
+            self.done.set()
+
+
+class NullSupervisor(Supervisor):
+    # Startet keine Prozesse, sondern meldet sofort Erfolg: misst nur den Python-Pfad.
+    async def spawn(self, action):
+        self.started += 1
+        self.finished += 1
+        return action
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux liefert KiB, macOS Bytes.
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def bench_actions(backend, mapping):
+    if backend == "true":
+        # Gleiche Notenbelegung und Optionen, aber jeder Befehl ist /bin/true.
+        patched = {note: dict(entry, command={"default": "true"}) for note, entry in mapping.items()}
+        return compile_mapping(patched, os_key="default")
+    return compile_mapping(mapping)
+
+
+async def run_benchmark(backend="noop", note_rate=1000.0, clock_rate=0.0, duration=1.0,
+                        count=None, queue_size=4096, notes=None, raw=False):
+    mapping = load_mapping()
+    actions = bench_actions(backend, mapping)
+    supervisor = NullSupervisor() if backend == "noop" else Supervisor(max_children=None, max_per_action=None)
+    notes = notes or sorted(mapping)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Wie im Programm: Tastendrücke gehen über den Log-Thread, hier nach /dev/null.
+        log = EventLog(stream=devnull)
+        engine = Engine(actions, queue_size=queue_size, supervisor=supervisor, log=log)
+        engine.bind()
+        runner = asyncio.get_running_loop().create_task(engine.run())
+        callback = engine.raw_feeder(0) if raw else engine.feed
+        start = time.perf_counter()
+        # CPU-Zeit des ganzen Prozesses, also auch die des Eingangs-Threads (mido baut dort die
+        # Nachrichten, wie im rtmidi-Thread).
+        cpu_start = time.process_time()
+        with SyntheticInput("synthetic", callback=callback, notes=notes, note_rate=note_rate,
+                            clock_rate=clock_rate, duration=duration, count=count, raw=raw) as port:
+            while not port.done.is_set():
+                await asyncio.sleep(0.01)
+            while engine.received + engine.raw_dropped < port.sent:
+                await asyncio.sleep(0.001)
+            await engine.drain()
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        if backend != "noop":
+            while supervisor.live:
+                await asyncio.sleep(0.01)
+        log.close()
+    runner.cancel()
+    return {
+        "backend": backend,
+        "path": "raw" if raw else "mido",
+        "sent": port.sent,
+        "elapsed": elapsed,
+        "cpu": cpu,
+        # Nur tatsächlich verarbeitete Nachrichten; verworfene zählen nicht als Durchsatz.
+        "handled": engine.received + engine.raw_dropped - engine.stats()["dropped"],
+        "rate": (engine.received + engine.raw_dropped - engine.stats()["dropped"]) / elapsed if elapsed else 0.0,
+        "engine": engine.stats(),
+        "latency": engine.latency.summary(),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def measure_startup(runs, port=None):
+    # Misst von außen die Zeit vom Prozessstart bis zur Bereitschaftsmeldung von ko.py.
+    # Ohne Port wird eine leere Aufnahme abgespielt: dann ohne MIDI-Backend, aber mit
+    # Interpreterstart, Imports, Mapping-Cache und Engine.
+    import statistics
+    import subprocess
+    import tempfile
+
+    from ko_session import HEADER
+
+    with tempfile.TemporaryDirectory() as tmp:
+        args = [sys.executable, KO_SCRIPT, "--startup-check", "--no-watch"]
+        if port:
+            args += ["--port", port]
+        else:
+            empty = os.path.join(tmp, "empty.ko2s")
+            with open(empty, "wb") as f:
+                f.write(HEADER)
+            args += ["--replay", empty]
+        env = dict(os.environ, PYTHONIOENCODING="utf-8")
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.Popen(args, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                                    env=env, text=True, encoding="utf-8")
+            ready = None
+            for line in proc.stdout:
+                if line.startswith(READY_MARKER):
+                    ready = time.perf_counter() - start
+            proc.wait()
+            if ready is None:
+                raise RuntimeError(f"ko.py wurde nicht bereit (Code {proc.returncode})")
+            times.append(ready * 1000)
+    return {"runs": runs, "min": min(times), "median": statistics.median(times), "max": max(times)}
+
+
+def format_result(result):
+    stats = result["engine"]
+    lines = [
+        f"Backend: {result['backend']}, Eingang: {result['path']}",
+        f"Nachrichten: {result['sent']} gesendet, {stats['received']} empfangen, "
+        f"{stats['dropped']} verworfen, {stats['dispatched']} Befehle gestartet",
+        f"Durchsatz: {result['rate']:.0f} verarbeitete Nachrichten/s in {result['elapsed']:.2f}s",
+        f"CPU: {cpu_per_message(result) * 1e6:.2f}µs pro verarbeiteter Nachricht",
+        f"Max. Queue-Tiefe: {stats['max_depth']}",
+        f"Peak RSS: {result['peak_rss_kb'] / 1024:.1f} MiB",
+        "Latenzen (" + " / ".join(f"p{p}" for p in PERCENTILES) + " / max):",
+    ]
+    for stage, values in result["latency"].items():
+        if values["count"]:
+            latencies = " / ".join(format_ns(values[f"p{p}"]) for p in PERCENTILES)
+            lines.append(f"  {stage:<9}{latencies} / {format_ns(values['max'])}  (n={values['count']})")
+    return "\n".join(lines)
+
+
+def cpu_per_message(result):
+    return result["cpu"] / result["handled"] if result["handled"] else 0.0
+
+
+def format_comparison(mido_result, raw_result):
+    dropped = (mido_result["engine"]["dropped"], raw_result["engine"]["dropped"])
+    line = f"Verworfen: mido {dropped[0]}, roh {dropped[1]}"
+    if dropped[0] != dropped[1]:
+        # Unterschiedlich viel verarbeitet: Durchsatz und CPU pro Nachricht sind nicht vergleichbar.
+        return f"{line} -> ⚠️ kein Vergleich, niedrigere Rate wählen"
+    queue = [r["latency"]["queue"] for r in (mido_result, raw_result)]
+    return (f"{line}; Rohdatenpfad: {raw_result['rate'] / mido_result['rate']:.2f}x Durchsatz, "
+            f"{cpu_per_message(mido_result) / cpu_per_message(raw_result):.2f}x weniger CPU pro Nachricht, "
+            f"Queue p50 {format_ns(queue[0]['p50'])} -> {format_ns(queue[1]['p50'])}, "
+            f"p99 {format_ns(queue[0]['p99'])} -> {format_ns(queue[1]['p99'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark des KO2-Dispatch-Pfads mit synthetischem MIDI-Input")
+    parser.add_argument("--backend", choices=("noop", "true"), default="noop",
+                        help="noop: keine Prozesse starten, true: /bin/true für jede Taste starten")
+    parser.add_argument("--note-rate", type=float, default=1000.0,
+                        help="note_on pro Sekunde (jeweils mit note_off), negativ = so schnell wie möglich")
+    parser.add_argument("--clock-rate", type=float, default=0.0, help="MIDI-Clock-Nachrichten pro Sekunde")
+    parser.add_argument("--duration", type=float, default=2.0, help="Dauer in Sekunden")
+    parser.add_argument("--count", type=int, default=None, help="maximale Anzahl Nachrichten")
+    parser.add_argument("--queue-size", type=int, default=4096)
+    parser.add_argument("--raw", action="store_true",
+                        help="Rohdatenpfad (Ringpuffer, ko_raw.py) statt mido-Nachrichten messen")
+    parser.add_argument("--compare", action="store_true",
+                        help="mido- und Rohdatenpfad nacheinander messen und vergleichen")
+    parser.add_argument("--max-p99-us", type=float, default=None,
+                        help="Fehlschlag, wenn die p99-Latenz (total bzw. dispatch) darüber liegt")
+    parser.add_argument("--startup", type=int, metavar="N", default=0,
+                        help="statt des Durchsatzes die Startzeit von ko.py in N Läufen messen")
+    parser.add_argument("--startup-port", metavar="NAME", default=None,
+                        help="echten MIDI-Port für --startup öffnen (sonst leere Aufnahme)")
+    parser.add_argument("--max-startup-ms", type=float, default=None,
+                        help="Fehlschlag, wenn der Median der Startzeit darüber liegt")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        result = measure_startup(args.startup, args.startup_port)
+        print(f"Start bis Bereitschaft ({result['runs']} Läufe): min {result['min']:.1f} ms, "
+              f"Median {result['median']:.1f} ms, max {result['max']:.1f} ms")
+        if args.max_startup_ms is not None and result["median"] > args.max_startup_ms:
+            print(f"❌ Median {result['median']:.1f} ms liegt über {args.max_startup_ms:.1f} ms")
+            return 1
+        return 0
+
+    install_child_watcher()
+    if args.compare:
+        results = [asyncio.run(run_benchmark(args.backend, args.note_rate, args.clock_rate, args.duration,
+                                             args.count, args.queue_size, raw=raw)) for raw in (False, True)]
+        for result in results:
+            print(format_result(result))
+            print()
+        print(format_comparison(*results))
+        result = results[1]
+    else:
+        result = asyncio.run(run_benchmark(args.backend, args.note_rate, args.clock_rate, args.duration,
+                                           args.count, args.queue_size, raw=args.raw))
+        print(format_result(result))
+    if args.max_p99_us is not None:
+        stage = "total" if result["latency"]["total"]["count"] else "dispatch"
+        p99_us = result["latency"][stage]["p99"] / 1000
+        if p99_us > args.max_p99_us:
+            print(f"❌ p99 ({stage}) {p99_us:.1f}µs liegt über {args.max_p99_us:.1f}µs")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+from ko_dispatch import VALUE, build_argv, format_amount
+
+
+def render(action, value):
+    # value ist bereits über die Kurve umgerechnet.
+    spec = action.cc
+    text = format_amount(value)
+    log_line = f"🎚️ {action.name} (CC {spec.control}) = {text}"
+    native = action.native
+    if native is not None and native.action == "volume.set":
+        native = native._replace(value=value)
+    if spec.template is None:
+        return action.replace(log_line=log_line, native=native)
+    command = spec.template.replace(VALUE, text)
+    argv, shell = build_argv(command, spec.os_key)
+    return action.replace(command=command, argv=argv, shell=shell, log_line=log_line, native=native)
+
+
+class CcThrottle:
+    # Drosselt die Wertströme der Regler: der erste Wert wird sofort angewendet, danach
+    # höchstens einer pro spec.interval. Was dazwischen kommt, überschreibt nur den wartenden
+    # Wert (der neueste gewinnt); am Ende des Intervalls wird er angewendet. Die Verzögerung
+    # ist damit höchstens ein Intervall, und die letzte Reglerstellung geht nie verloren.
+    def __init__(self, loop, fire):
+        self.loop = loop
+        self.fire = fire
+        # key -> [action, roher Wert oder None, zuletzt angewendeter Ausgabewert]
+        self._state = {}
+        self.applied = 0
+        self.merged = 0
+        self.skipped = 0
+
+    def stats(self):
+        return {"active": len(self._state), "applied": self.applied, "merged": self.merged,
+                "skipped": self.skipped}
+
+    def submit(self, action, raw, key=None):
+        key = action.note if key is None else key
+        state = self._state.get(key)
+        if state is None:
+            self._state[key] = [action, None, None]
+            self._apply(key, action, raw)
+        else:
+            if state[1] is not None:
+                self.merged += 1
+            state[0] = action
+            state[1] = raw
+
+    def _apply(self, key, action, raw):
+        state = self._state[key]
+        value = action.cc.values[raw]
+        if value == state[2]:
+            # Gleicher Ausgabewert (z.B. flache Kurve oder Rundung): kein Befehl.
+            self.skipped += 1
+        else:
+            state[2] = value
+            self.applied += 1
+            self.fire(render(action, value))
+        self.loop.call_later(action.cc.interval, self._tick, key)
+
+    def _tick(self, key):
+        state = self._state.get(key)
+        if state is None:
+            return
+        action, raw, _ = state
+        if raw is None:
+            # Regler steht still: Zustand freigeben, der nächste Wert geht wieder sofort durch.
+            del self._state[key]
+            return
+        state[1] = None
+        self._apply(key, action, raw)
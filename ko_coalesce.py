@@ -0,0 +1,51 @@
+from ko_dispatch import AMOUNT, build_argv, format_amount
+
+
+def render(action, count):
+    spec = action.coalesce
+    command = spec.template.replace(AMOUNT, format_amount(spec.step * count))
+    argv, shell = build_argv(command, spec.os_key)
+    log_line = action.log_line[:-len(action.command)] + command
+    native = action.native
+    if native is not None and native.delta is not None:
+        native = native._replace(delta=native.delta * count)
+    return action.replace(command=command, argv=argv, shell=shell, log_line=log_line, native=native)
+
+
+class Coalescer:
+    # Sammelt Tastendrücke einer Note ab dem ersten Druck für spec.window Sekunden
+    # und ruft danach fire() genau einmal auf:
+    #   sum    -> ein Befehl mit aufsummiertem Parameter (3x 5%+ wird 15%+)
+    #   toggle -> nur bei ungerader Anzahl ein Umschalten, gerade Anzahl hebt sich auf
+    def __init__(self, loop, fire):
+        self.loop = loop
+        self.fire = fire
+        self._pending = {}
+        self.bursts = 0
+        self.merged = 0
+
+    def stats(self):
+        return {"pending": len(self._pending), "bursts": self.bursts, "merged": self.merged}
+
+    def submit(self, action, key=None):
+        # key trennt Bursts, z.B. (port, note) bei mehreren Eingängen; Standard ist die Note.
+        key = action.note if key is None else key
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = [action, 1]
+            self.loop.call_later(action.coalesce.window, self._flush, key)
+        else:
+            pending[0] = action
+            pending[1] += 1
+            self.merged += 1
+
+    def _flush(self, key):
+        action, count = self._pending.pop(key)
+        self.bursts += 1
+        spec = action.coalesce
+        if spec.mode == "sum":
+            if count > 1:
+                action = render(action, count)
+            self.fire(action)
+        elif count % 2:
+            self.fire(action)
@@ -0,0 +1,155 @@
+from itertools import combinations
+
+from ko_dispatch import NOTE_SLOTS
+
+
+class _Node:
+    # Knoten im Präfixbaum der Sequenzen: children[note] -> _Node, action am Ende einer Sequenz.
+    __slots__ = ("children", "action", "window")
+
+    def __init__(self):
+        self.children = {}
+        self.action = None
+        self.window = 0.0
+
+
+class ComboSet:
+    # Unveränderliche Suchstrukturen für alle Kombinationen eines Mappings:
+    #   starts[note]    -> 1, wenn die Note eine Kombination beginnen kann (sonst sofort auslösen)
+    #   root            -> Präfixbaum der Sequenzen
+    #   chords[set]     -> Aktion des Akkords aus genau diesen Noten
+    #   partial[set]    -> längstes Zeitfenster, wenn die Notenmenge Teil eines größeren Akkords ist
+    # Jeder Schritt ist damit ein Dict-Zugriff, unabhängig von der Zahl der Kombinationen.
+    def __init__(self, combos=()):
+        self.starts = bytearray(NOTE_SLOTS)
+        self.root = _Node()
+        self.chords = {}
+        self.partial = {}
+        for spec in combos:
+            if spec.kind == "sequence":
+                node = self.root
+                for note in spec.notes:
+                    node = node.children.setdefault(note, _Node())
+                    node.window = max(node.window, spec.window)
+                node.action = spec.action
+                self.starts[spec.notes[0]] = 1
+            else:
+                notes = frozenset(spec.notes)
+                self.chords[notes] = spec.action
+                for size in range(1, len(notes)):
+                    for subset in combinations(notes, size):
+                        key = frozenset(subset)
+                        self.partial[key] = max(self.partial.get(key, 0.0), spec.window)
+                for note in notes:
+                    self.starts[note] = 1
+
+    def __bool__(self):
+        return bool(self.chords or self.root.children)
+
+
+class ComboMatcher:
+    # Zustandsautomat für einen Eingang. Tasten, die eine Kombination beginnen könnten, werden
+    # zurückgehalten, bis die Kombination vollständig ist (dann nur deren Aktion), nicht mehr
+    # möglich ist oder das Zeitfenster abläuft (dann die Einzelaktionen in Reihenfolge).
+    # Es läuft höchstens ein Timer, der bei jedem passenden Schritt neu gestellt wird.
+    def __init__(self, combos, loop, fire):
+        self.combos = combos
+        self.loop = loop
+        self.fire = fire
+        self.matched = 0
+        self.released = 0
+        self.pending = []
+        self._chord = None
+        self._node = None
+        self._timer = None
+
+    def stats(self):
+        return {"pending": len(self.pending), "matched": self.matched, "released": self.released}
+
+    def press(self, note, action):
+        if not self.pending:
+            self._start(note, action)
+            return
+        combos = self.combos
+        chord = None
+        if self._chord is not None and note not in self._chord:
+            chord = self._chord | {note}
+            if chord not in combos.chords and chord not in combos.partial:
+                chord = None
+        node = self._node.children.get(note) if self._node is not None else None
+        if chord is not None and chord not in combos.partial:
+            self._complete(combos.chords[chord])
+        elif node is not None and node.action is not None and not node.children:
+            self._complete(node.action)
+        elif chord is None and node is None:
+            # Keine Kombination mehr möglich: Gesammeltes einzeln auslösen, Note neu bewerten.
+            self.flush()
+            self._start(note, action)
+        else:
+            self.pending.append((note, action))
+            self._chord = chord
+            self._node = node
+            self._arm()
+
+    def release(self, note):
+        # Ein Akkord zählt nur, solange seine Noten gehalten werden.
+        if self._chord is None or note not in self._chord:
+            return
+        action = self.combos.chords.get(self._chord)
+        if action is not None:
+            self._complete(action)
+            return
+        self._chord = None
+        if self._node is None:
+            self.flush()
+
+    def _start(self, note, action):
+        combos = self.combos
+        if not combos.starts[note]:
+            self.fire(action, note)
+            return
+        chord = frozenset((note,))
+        self._chord = chord if chord in combos.partial else None
+        self._node = combos.root.children.get(note)
+        self.pending.append((note, action))
+        self._arm()
+
+    def _arm(self):
+        window = 0.0
+        if self._chord is not None:
+            window = self.combos.partial.get(self._chord, 0.0)
+        if self._node is not None:
+            window = max(window, self._node.window)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self.loop.call_later(window, self._timeout)
+
+    def _timeout(self):
+        self._timer = None
+        action = self.combos.chords.get(self._chord) if self._chord is not None else None
+        if action is None and self._node is not None:
+            action = self._node.action
+        if action is not None:
+            self._complete(action)
+        else:
+            self.flush()
+
+    def _complete(self, action):
+        self._reset()
+        self.matched += 1
+        self.fire(action, None)
+
+    def _reset(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = self.pending
+        self.pending = []
+        self._chord = None
+        self._node = None
+        return pending
+
+    def flush(self):
+        for note, action in self._reset():
+            self.released += 1
+            self.fire(action, note)
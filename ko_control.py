@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+
+from ko_log import format_json
+
+# Höchstzahl gleichzeitiger Clients; weitere werden sofort getrennt.
+MAX_CLIENTS = 32
+# So viele Ereignisse puffert ein Abonnent; liest er zu langsam, werden ältere verworfen.
+SUBSCRIBER_QUEUE = 1024
+COMMANDS = ("press", "release", "cc", "stats", "latency", "reload", "subscribe", "ping")
+
+
+DEFAULT_SOCKET_HELP = "$XDG_RUNTIME_DIR/ko2-midi-commander.sock, sonst /tmp/ko2-midi-commander-<uid>.sock"
+
+
+UNSUPPORTED = "Der Steuerungs-Socket wird auf dieser Plattform nicht unterstützt"
+
+
+def default_socket_path():
+    if not ControlServer.supported():
+        raise RuntimeError(UNSUPPORTED)
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "ko2-midi-commander.sock")
+    return os.path.join("/tmp", f"ko2-midi-commander-{os.getuid()}.sock")
+
+
+class _Subscriber:
+    # Der Dispatcher hängt nur das Rohereignis an; formatiert und geschrieben wird in der
+    # Schreib-Coroutine des Clients, die auf drain() warten darf.
+    __slots__ = ("records", "wake", "dropped")
+
+    def __init__(self):
+        self.records = deque(maxlen=SUBSCRIBER_QUEUE)
+        self.wake = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, record):
+        if len(self.records) == SUBSCRIBER_QUEUE:
+            self.dropped += 1
+        self.records.append(record)
+        self.wake.set()
+
+
+class LogTee:
+    # Ersetzt engine.log: alles geht weiter an das eigentliche Log und zusätzlich an die
+    # Abonnenten des Ereignisstroms. Ohne Abonnenten kostet das nur eine leere Schleife.
+    def __init__(self, log):
+        self.log = log
+        self.subscribers = set()
+
+    def _publish(self, kind, port, item):
+        if self.subscribers:
+            record = (time.time_ns(), kind, port, item)
+            for subscriber in self.subscribers:
+                subscriber.put(record)
+
+    def press(self, action, port=0):
+        self.log.press(action, port)
+        self._publish("press", port, action)
+
+    def unknown(self, note, port=0):
+        self.log.unknown(note, port)
+        self._publish("unknown", port, note)
+
+    def message(self, text, port=None):
+        self.log.message(text, port)
+        self._publish("message", port, text)
+
+    def stats(self):
+        return self.log.stats()
+
+    def close(self):
+        self.log.close()
+
+
+class ControlServer:
+    # Steuerung über einen Unix-Socket, eine JSON-Zeile pro Anfrage und Antwort:
+    #   {"cmd": "press", "note": 36}            Tastendruck einspeisen (wie vom Gerät)
+    #   {"cmd": "cc", "control": 1, "value": 64} Reglerwert einspeisen
+    #   {"cmd": "stats"} / {"cmd": "latency"}    Zähler bzw. Latenz-Perzentile
+    #   {"cmd": "reload"}                        Mapping-Datei neu laden
+    #   {"cmd": "subscribe"}                     danach eine JSON-Zeile pro Ereignis
+    # Alle Clients laufen als Coroutinen in der Event-Loop des Dispatchers. Eingespeiste
+    # Ereignisse gehen durch dieselbe Queue wie MIDI-Nachrichten, das Neuladen läuft in
+    # einem Thread, und kein Client kann durch langsames Lesen den Dispatcher aufhalten.
+    def __init__(self, engine, path=None, mapping_path=None, watcher=None):
+        self.engine = engine
+        self.path = path or default_socket_path()
+        self.mapping_path = mapping_path
+        self.watcher = watcher
+        self.tee = LogTee(engine.log)
+        self.clients = 0
+        self.requests = 0
+        self.errors = 0
+        self._server = None
+        self._handlers = {}
+
+    @staticmethod
+    def supported():
+        # Unix-Sockets und Benutzer-IDs gibt es nur unter POSIX.
+        return hasattr(socket, "AF_UNIX") and hasattr(os, "getuid")
+
+    def stats(self):
+        return {"clients": self.clients, "subscribers": len(self.tee.subscribers),
+                "requests": self.requests, "errors": self.errors}
+
+    async def start(self):
+        self._remove_stale()
+        self.engine.set_log(self.tee)
+        # Schon beim bind() nur für den eigenen Benutzer: ein nachträgliches chmod ließe unter
+        # /tmp ein Fenster, in dem andere verbinden und Befehle auslösen könnten.
+        umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self._handle, self.path)
+        finally:
+            os.umask(umask)
+
+    def _remove_stale(self):
+        # Ein übrig gebliebener Socket eines abgestürzten Laufs wird entfernt, ein lebender nicht.
+        if not os.path.exists(self.path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except OSError:
+            os.unlink(self.path)
+        else:
+            raise RuntimeError(f"{self.path} wird bereits von einer anderen Instanz benutzt")
+        finally:
+            probe.close()
+
+    async def close(self):
+        if self._server is None:
+            return
+        self._server.close()
+        # Verbindungen schließen statt die Handler abzubrechen: sie sehen EOF und enden selbst.
+        for writer in list(self._handlers.values()):
+            writer.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        await self._server.wait_closed()
+        self._server = None
+        self.engine.set_log(self.tee.log)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    async def _handle(self, reader, writer):
+        if self.clients >= MAX_CLIENTS:
+            writer.close()
+            return
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("Anfrage muss ein JSON-Objekt sein")
+                    self.requests += 1
+                    if request.get("cmd") == "subscribe":
+                        await self._send(writer, {"ok": True})
+                        await self._stream(reader, writer)
+                        break
+                    reply = await self.execute(request)
+                except KeyError as e:
+                    self.errors += 1
+                    reply = {"ok": False, "error": f"Feld {e} fehlt"}
+                except (ValueError, TypeError) as e:
+                    self.errors += 1
+                    reply = {"ok": False, "error": str(e)}
+                await self._send(writer, reply)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.clients -= 1
+            self._handlers.pop(task, None)
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, reply):
+        writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+        await writer.drain()
+
+    async def _stream(self, reader, writer):
+        subscriber = _Subscriber()
+        self.tee.subscribers.add(subscriber)
+        # Trennt der Client die Verbindung, endet der Strom, auch wenn gerade nichts passiert.
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            while not closed.done():
+                waiter = asyncio.ensure_future(subscriber.wake.wait())
+                await asyncio.wait((waiter, closed), return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                subscriber.wake.clear()
+                records = subscriber.records
+                lines = []
+                if subscriber.dropped:
+                    lines.append(json.dumps({"event": "dropped", "count": subscriber.dropped}))
+                    subscriber.dropped = 0
+                while records:
+                    lines.append(format_json(records.popleft()))
+                if lines:
+                    writer.write(("\n".join(lines) + "\n").encode())
+                    await writer.drain()
+        finally:
+            self.tee.subscribers.discard(subscriber)
+            closed.cancel()
+
+    def _port(self, request):
+        port = int(request.get("port", 0))
+        if not 0 <= port < len(self.engine.port_names):
+            raise ValueError(f"Unbekannter Eingang {port}")
+        return port
+
+    async def execute(self, request):
+        import mido
+        cmd = request.get("cmd")
+        engine = self.engine
+        if cmd == "press":
+            engine.inject(mido.Message("note_on", note=int(request["note"]),
+                                       velocity=int(request.get("velocity", 127))), self._port(request))
+        elif cmd == "release":
+            engine.inject(mido.Message("note_off", note=int(request["note"])), self._port(request))
+        elif cmd == "cc":
+            engine.inject(mido.Message("control_change", control=int(request["control"]),
+                                       value=int(request["value"])), self._port(request))
+        elif cmd == "stats":
+            return {"ok": True, "stats": engine.stats(), "control": self.stats()}
+        elif cmd == "latency":
+            return {"ok": True, "latency": engine.latency.summary(), "report": engine.latency.report()}
+        elif cmd == "reload":
+            return await self.reload()
+        elif cmd != "ping":
+            raise ValueError(f"Unbekannter Befehl {cmd!r}, erlaubt: {', '.join(COMMANDS)}")
+        return {"ok": True}
+
+    async def reload(self):
+        from ko_mapping import reload_mapping
+        if self.mapping_path is None:
+            return {"ok": False, "error": "keine Mapping-Datei bekannt"}
+        try:
+            digest = await reload_mapping(self.engine, self.mapping_path, source="Steuerung")
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        if self.watcher is not None:
+            # Sonst lädt der Watcher dieselbe Änderung noch einmal.
+            self.watcher.digest = digest
+        return {"ok": True, "assigned": self.engine.mapping.assigned()}
+
+
+async def request(path, message, stream=False):
+    reader, writer = await asyncio.open_unix_connection(path)
+    try:
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            sys.stdout.write(line.decode())
+            sys.stdout.flush()
+            if not stream:
+                return
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    # Kleiner Client, z.B. python ko_control.py press 36 oder python ko_control.py subscribe
+    parser = argparse.ArgumentParser(description="Steuert einen laufenden KO2 MIDI Commander")
+    parser.add_argument("--socket", metavar="PFAD", help=f"Standard: {DEFAULT_SOCKET_HELP}")
+    parser.add_argument("--port", type=int, default=0, help="Eingang für press/release/cc")
+    parser.add_argument("cmd", choices=COMMANDS)
+    parser.add_argument("args", nargs="*", type=int, help="Note bzw. Controller und Wert")
+    args = parser.parse_args(argv)
+    if not ControlServer.supported():
+        parser.error(UNSUPPORTED)
+    args.socket = args.socket or default_socket_path()
+    message = {"cmd": args.cmd, "port": args.port}
+    if args.cmd in ("press", "release"):
+        if len(args.args) != 1:
+            parser.error(f"{args.cmd} braucht genau eine Note")
+        message["note"] = args.args[0]
+    elif args.cmd == "cc":
+        if len(args.args) != 2:
+            parser.error("cc braucht Controller und Wert")
+        message["control"], message["value"] = args.args
+    try:
+        asyncio.run(request(args.socket, message, stream=args.cmd == "subscribe"))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Keine Verbindung zu {args.socket}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
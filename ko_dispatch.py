@@ -0,0 +1,564 @@
+import platform
+import re
+import shlex
+import subprocess
+from collections import namedtuple
+
+# MIDI kennt nur 7-Bit-Noten, deshalb reicht eine feste Tabelle mit 128 Plätzen.
+NOTE_SLOTS = 128
+
+_OS_KEYS = {"Windows": "windows", "Darwin": "darwin", "Linux": "linux"}
+
+# Zeichen, die nur eine Shell korrekt auswertet (Tilde, Globs, Pipes, Variablen, Kommentare,
+# Zeilenumbrüche ...), dazu Zuweisungen vor dem Befehl (NAME=wert befehl). Befehle ohne diese
+# und ohne Builtin oder Schlüsselwort am Anfang werden direkt ohne /bin/sh gestartet.
+_SHELL_CHARS = re.compile(r"[~*?\[\]$|&;<>()`{}#!\n]|^\s*[A-Za-z_][A-Za-z0-9_]*=")
+_SHELL_WORDS = frozenset((
+    "alias", "bg", "break", "case", "cd", "command", "continue", "eval", "exec", "exit", "export",
+    "fg", "for", "getopts", "hash", "if", "jobs", "read", "readonly", "return", "set", "shift",
+    "source", "test", "times", "trap", "type", "ulimit", "umask", "unalias", "unset", "until",
+    "wait", "while", ".", ":",
+))
+
+# Platzhalter für den aufsummierten Parameter beim Zusammenfassen (coalesce).
+AMOUNT = "{amount}"
+COALESCE_MODES = ("sum", "toggle")
+DEFAULT_COALESCE_WINDOW = 0.15
+
+CoalesceSpec = namedtuple("CoalesceSpec", "mode window step template os_key")
+
+# Aktionen, die ohne eigenen Prozess direkt im Programm laufen (siehe ko_native.py),
+# mit ihren Standardparametern. Der Shell-Befehl des Eintrags bleibt der Ersatz.
+NATIVE_DEFAULTS = {
+    "mpris.next": {"player": "spotify"},
+    "mpris.previous": {"player": "spotify"},
+    "mpris.play_pause": {"player": "spotify"},
+    "volume.step": {"delta": 5, "device": "pulse", "control": "Master"},
+    "volume.toggle_mute": {"device": "pulse", "control": "Master"},
+    "mic.toggle_mute": {"device": "default", "control": "Capture"},
+    "volume.set": {"device": "pulse", "control": "Master"},
+}
+
+NativeSpec = namedtuple("NativeSpec", "action player delta device control value")
+
+# LED-Rückmeldung über den MIDI-Ausgang (siehe ko_leds.py):
+#   running -> leuchtet, solange ein gestarteter Prozess der Taste läuft
+#   toggle  -> wechselt bei jeder Ausführung zwischen an und aus
+#   off     -> keine Rückmeldung für diese Taste
+LED_MODES = ("running", "toggle", "off")
+LedSpec = namedtuple("LedSpec", "mode on off cc")
+
+# Kombinationen aus mehreren Tasten (siehe ko_combo.py):
+#   chord    -> alle Noten gleichzeitig gedrückt, Reihenfolge egal
+#   sequence -> Noten nacheinander, jeweils innerhalb von window Sekunden
+COMBO_TYPES = ("chord", "sequence")
+DEFAULT_COMBO_WINDOW = 0.3
+MAX_CHORD_NOTES = 6
+ComboSpec = namedtuple("ComboSpec", "kind notes window action")
+
+# Drehregler und Fader ([cc.NUMMER], siehe ko_cc.py). {value} im Befehl wird durch den über
+# eine 128er-Tabelle (Kurve, min, max) umgerechneten Reglerwert ersetzt.
+VALUE = "{value}"
+CC_CURVES = ("linear", "log", "exp")
+DEFAULT_CC_INTERVAL = 0.05
+# Virtuelle Noten der Regler, weit hinter denen der Kombinationen.
+CC_BASE = 1 << 16
+CcSpec = namedtuple("CcSpec", "control interval values template os_key")
+
+# Nur starten, wenn das Programm noch nicht läuft (siehe ko_procs.py). names sind die gesuchten
+# Prozessnamen in Kleinbuchstaben, focus ein optionaler Befehl, der stattdessen das Fenster holt.
+SingleSpec = namedtuple("SingleSpec", "names focus focus_argv focus_shell")
+
+# Reihenfolge beim Starten, wenn mehrere Aktionen warten (siehe ko_scheduler.py); "critical"
+# ist für Sperren, Stummschalten und Ähnliches gedacht und hat einen reservierten Startplatz.
+PRIORITIES = ("critical", "high", "normal", "low")
+
+# Aktionen auf anderen Rechnern (siehe ko_remote.py und ko_agent.py): target = "NAME" im
+# Eintrag, der Agent steht in [targets.NAME] mit address = "host:port" und optional token.
+# Der Befehl wird erst für das Betriebssystem des Agenten ausgewählt, daher bleiben alle erhalten.
+DEFAULT_AGENT_PORT = 7071
+TargetSpec = namedtuple("TargetSpec", "name commands")
+AgentSpec = namedtuple("AgentSpec", "name host port token")
+
+# Ebenen und MIDI-Kanäle: jede Ebene ist pro Eingang eine flache Tabelle mit CHANNELS *
+# NOTE_SLOTS Plätzen, Index (kanal << 7) | note. Eine Ebene wird über eine Taste aktiviert:
+#   hold -> solange die Taste gehalten wird (Shift)
+#   page -> jeder Druck schaltet zwischen Basis und Ebene um
+CHANNELS = 16
+LAYER_MODES = ("hold", "page")
+LayerSpec = namedtuple("LayerSpec", "name mode note notes channels switch")
+LayerSwitch = namedtuple("LayerSwitch", "mode layer")
+
+# Sequencer des KO II (siehe ko_tempo.py): quantize = "beat" oder "bar" verschiebt den Start auf
+# den nächsten Schlag bzw. Takt der MIDI-Clock. [transport.start], [transport.continue] und
+# [transport.stop] sind Einträge wie bei den Noten, ausgelöst von den Transport-Nachrichten.
+QUANTIZE_UNITS = ("beat", "bar")
+TRANSPORT_EVENTS = ("start", "continue", "stop")
+TRANSPORT_BASE = 2 << 16
+
+# Wird beim Import einmal bestimmt und nicht mehr bei jedem Tastendruck.
+HOST_OS = platform.system()
+
+
+def slot_label(note):
+    if note >= TRANSPORT_BASE:
+        return f"Transport {TRANSPORT_EVENTS[note - TRANSPORT_BASE]}"
+    if note >= CC_BASE:
+        return f"CC {note - CC_BASE}"
+    if note >= NOTE_SLOTS:
+        return f"Kombination {note - NOTE_SLOTS + 1}"
+    return f"Note {note}"
+
+
+def resolve_os_key(system=None):
+    return _OS_KEYS.get(HOST_OS if system is None else system, "default")
+
+
+def select_command(command_config, os_key):
+    # Gleiche Reihenfolge wie früher: erst der OS-spezifische Eintrag, dann "default".
+    if os_key in command_config:
+        return command_config[os_key]
+    return command_config.get("default")
+
+
+def build_argv(command, os_key):
+    # Unter Windows braucht fast alles cmd.exe (start, URIs, Builtins), dort bleibt es bei shell=True.
+    if os_key == "windows":
+        return command, True
+    if _SHELL_CHARS.search(command):
+        return ("/bin/sh", "-c", command), False
+    try:
+        argv = tuple(shlex.split(command))
+    except ValueError:
+        return ("/bin/sh", "-c", command), False
+    if not argv or argv[0] in _SHELL_WORDS:
+        return ("/bin/sh", "-c", command), False
+    return argv, False
+
+
+# Optionale Felder eines mapping-Eintrags mit ihren Standardwerten.
+# max_instances: wie viele Prozesse dieser Taste gleichzeitig laufen dürfen
+# timeout: Sekunden, nach denen ein noch laufender Prozess beendet wird
+# coalesce: schnelle Wiederholungen derselben Taste zu einer Ausführung zusammenfassen
+# executor: "shell" führt kurze Befehle in einer warmen Coprocess-Shell aus (siehe ko_shell.py)
+# native: Aktion ohne Prozessstart, z.B. {"action": "volume.step", "delta": 5}
+# led: Rückmeldung auf dem Gerät, z.B. {"mode": "toggle", "on": 127, "off": 0, "cc": 20}
+# single_instance: true, Prozessname oder {"process": ..., "focus": {os: befehl}}; läuft das
+#   Programm schon, wird nicht neu gestartet, sondern nur focus ausgeführt (oder nichts)
+# priority: "critical", "high", "normal" oder "low", entscheidet bei vollen Startplätzen
+# target: Name eines Agenten aus [targets], der Befehl läuft dann dort statt lokal
+# quantize: "beat" oder "bar", startet erst auf dem nächsten Schlag bzw. Takt (nur mit --tempo)
+# layer: nur für die Umschalttasten aus [layers.NAME], wird dort gebaut
+# cc: nur für [cc.NUMMER]-Einträge, wird aus interval, curve, min und max gebaut
+ACTION_OPTIONS = {
+    "max_instances": None,
+    "timeout": None,
+    "coalesce": None,
+    "executor": None,
+    "native": None,
+    "led": None,
+    "single_instance": None,
+    "priority": "normal",
+    "target": None,
+    "quantize": None,
+    "layer": None,
+    "cc": None,
+}
+EXECUTORS = (None, "spawn", "shell")
+
+
+class Action:
+    __slots__ = ("note", "name", "command", "argv", "shell", "log_line") + tuple(ACTION_OPTIONS)
+
+    def __init__(self, note, name, command, argv, shell, log_line, **options):
+        object.__setattr__(self, "note", note)
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "command", command)
+        object.__setattr__(self, "argv", argv)
+        object.__setattr__(self, "shell", shell)
+        object.__setattr__(self, "log_line", log_line)
+        for key, default in ACTION_OPTIONS.items():
+            object.__setattr__(self, key, options.pop(key, default))
+        if options:
+            raise TypeError(f"Unbekannte Optionen: {', '.join(sorted(options))}")
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Action ist unveränderlich")
+
+    def __delattr__(self, key):
+        raise AttributeError("Action ist unveränderlich")
+
+    def __repr__(self):
+        return f"Action(note={self.note}, name={self.name!r}, argv={self.argv!r})"
+
+    def __reduce__(self):
+        # Für den Mapping-Cache: __setattr__ ist gesperrt, daher über __init__ wiederherstellen.
+        return (_restore_action, (tuple(getattr(self, key) for key in self.__slots__),))
+
+    def replace(self, **changes):
+        fields = {key: getattr(self, key) for key in self.__slots__}
+        fields.update(changes)
+        return Action(**fields)
+
+
+def _restore_action(values):
+    return Action(**dict(zip(Action.__slots__, values)))
+
+
+def format_amount(amount):
+    return f"{amount:g}" if isinstance(amount, float) else str(amount)
+
+
+def compile_coalesce(spec, command, os_key):
+    if spec is None:
+        return None
+    mode = spec.get("mode", "sum")
+    if mode not in COALESCE_MODES:
+        raise ValueError(f"Unbekannter coalesce-Modus: {mode!r}")
+    window = float(spec.get("window", DEFAULT_COALESCE_WINDOW))
+    step = spec.get("step", 1)
+    if mode == "sum" and AMOUNT not in command:
+        # Ohne Platzhalter lässt sich nichts aufsummieren (z.B. SendKeys unter Windows):
+        # dann wird jeder Tastendruck wie bisher einzeln ausgeführt.
+        return None
+    return CoalesceSpec(mode, window, step, command, os_key)
+
+
+def compile_single(spec, argv, shell, os_key):
+    if not spec:
+        return None
+    if spec is True:
+        spec = {}
+    elif isinstance(spec, str):
+        spec = {"process": spec}
+    process = spec.get("process")
+    if process is None:
+        # Ohne Angabe: der gestartete Befehl selbst, z.B. "discord" oder "/usr/bin/obs" -> obs.
+        if shell or argv[0] == "/bin/sh":
+            raise ValueError("single_instance braucht bei Shell-Befehlen einen Prozessnamen (process)")
+        process = argv[0].rsplit("/", 1)[-1]
+    names = tuple(sorted({name.lower() for name in (process if isinstance(process, list) else [process])}))
+    focus = spec.get("focus")
+    if isinstance(focus, dict):
+        focus = select_command(focus, os_key)
+    if not focus:
+        return SingleSpec(names, None, None, False)
+    focus_argv, focus_shell = build_argv(focus, os_key)
+    return SingleSpec(names, focus, focus_argv, focus_shell)
+
+
+def compile_native(spec):
+    if spec is None:
+        return None
+    name = spec.get("action")
+    if name not in NATIVE_DEFAULTS:
+        raise ValueError(f"Unbekannte native Aktion: {name!r}")
+    params = dict.fromkeys(NativeSpec._fields)
+    params.update(NATIVE_DEFAULTS[name])
+    for key, value in spec.items():
+        if key != "action" and key not in params:
+            raise ValueError(f"Unbekannter Parameter {key!r} für native Aktion {name}")
+        params[key] = value
+    return NativeSpec(**params)
+
+
+def compile_led(spec):
+    if spec is None:
+        return None
+    params = {"mode": None, "on": 127, "off": 0, "cc": None}
+    for key, value in spec.items():
+        if key not in params:
+            raise ValueError(f"Unbekannter Parameter {key!r} für led")
+        params[key] = value
+    if params["mode"] not in LED_MODES + (None,):
+        raise ValueError(f"Unbekannter led-Modus: {params['mode']!r}")
+    for key in ("on", "off", "cc"):
+        if params[key] is not None and not 0 <= params[key] < NOTE_SLOTS:
+            raise ValueError(f"led.{key} muss zwischen 0 und 127 liegen")
+    return LedSpec(**params)
+
+
+def compile_action(note, entry, os_key=None, system=None):
+    if os_key is None:
+        os_key = resolve_os_key(system)
+    system = HOST_OS if system is None else system
+    name = entry["name"]
+    options = {key: entry[key] for key in ACTION_OPTIONS if key in entry}
+    if options.get("executor") not in EXECUTORS:
+        raise ValueError(f"Unbekannter executor für Note {note}: {options['executor']!r}")
+    if options.get("priority", "normal") not in PRIORITIES:
+        raise ValueError(f"Unbekannte priority für Note {note}: {options['priority']!r}")
+    if options.get("priority") == "critical" and options.get("coalesce") is not None:
+        # Das Zeitfenster würde genau die Aktionen aufhalten, die sofort laufen sollen.
+        raise ValueError(f"Note {note}: priority = \"critical\" verträgt kein coalesce")
+    if options.get("quantize") not in (None,) + QUANTIZE_UNITS:
+        raise ValueError(f"Unbekanntes quantize für Note {note}: {options['quantize']!r}")
+    native = options["native"] = compile_native(options.get("native"))
+    options["led"] = compile_led(options.get("led"))
+    options["cc"] = None
+    options["layer"] = None
+    command = select_command(entry.get("command", {}), os_key)
+    pressed = f"🟢 gedrückt: {name} (Note {note})"
+    if options.get("target") is not None:
+        return compile_remote(note, entry, command, pressed, options)
+    if not command:
+        options["coalesce"] = None
+        options["single_instance"] = None
+        if native is not None:
+            return Action(note, name, None, None, False, f"{pressed}\nNative Aktion {native.action}", **options)
+        log_line = f"{pressed}\nKein Befehl für das aktuelle Betriebssystem ({system}) oder Standardbefehl definiert."
+        return Action(note, name, None, None, False, log_line, **options)
+    options["coalesce"] = compile_coalesce(options.get("coalesce"), command, os_key)
+    if AMOUNT in command:
+        step = (entry.get("coalesce") or {}).get("step", 1)
+        command = command.replace(AMOUNT, format_amount(step))
+    argv, shell = build_argv(command, os_key)
+    options["single_instance"] = compile_single(options.get("single_instance"), argv, shell, os_key)
+    if native is not None:
+        log_line = f"{pressed}\nNative Aktion {native.action}, sonst auf {system}: {command}"
+    else:
+        log_line = f"{pressed}\nFühre Befehl aus auf {system}: {command}"
+    return Action(note, name, command, argv, shell, log_line, **options)
+
+
+def compile_remote(note, entry, command, pressed, options):
+    target = options["target"]
+    if options["native"] is not None:
+        raise ValueError(f"Note {note}: native und target schließen sich aus")
+    commands = entry.get("command", {})
+    if not commands:
+        raise ValueError(f"Note {note}: target {target!r} ohne command")
+    options["target"] = TargetSpec(target, tuple(sorted(commands.items())))
+    options["coalesce"] = None
+    shown = command if command else "Befehl für das Betriebssystem des Agenten"
+    return Action(note, entry["name"], command, None, False, f"{pressed}\nAuf {target}: {shown}", **options)
+
+
+def compile_targets(sections):
+    # sections: {name: {"address": "host:port", "token": "..."}} -> Tupel von AgentSpec.
+    agents = []
+    for name, entry in sections.items():
+        address = entry.get("address")
+        if not isinstance(address, str) or not address:
+            raise ValueError(f"[targets.{name}]: address fehlt")
+        host, _, port = address.rpartition(":")
+        if not host:
+            host, port = address, DEFAULT_AGENT_PORT
+        try:
+            port = int(port)
+        except ValueError:
+            raise ValueError(f"[targets.{name}]: ungültiger Port in {address!r}")
+        agents.append(AgentSpec(name, host.strip("[]"), port, entry.get("token")))
+    return tuple(agents)
+
+
+def compile_mapping(mapping, os_key=None, system=None):
+    # Baut aus dem mapping-Dict eine dichte Tabelle: actions[note] -> Action oder None.
+    # Die Befehle der anderen Betriebssysteme werden dabei verworfen.
+    if os_key is None:
+        os_key = resolve_os_key(system)
+    table = [None] * NOTE_SLOTS
+    for note, entry in mapping.items():
+        if not 0 <= note < NOTE_SLOTS:
+            raise ValueError(f"Note {note} liegt außerhalb des MIDI-Bereichs 0-127")
+        table[note] = compile_action(note, entry, os_key, system)
+    return tuple(table)
+
+
+class CompiledMapping:
+    # Basistabelle für alle Ports plus Überlagerungen je Portmuster (Abschnitt [ports."MUSTER"]),
+    # je MIDI-Kanal ([channels.N]) und je Ebene ([layers.NAME]). banks_for() baut daraus einmal
+    # pro Port eine flache Tabelle pro Ebene, damit der Dispatcher nur zwei Indexzugriffe
+    # braucht: tables[port][(kanal << 7) | note]; eine Ebene wechseln heißt, tables[port] auf
+    # eine andere, fertige Tabelle zeigen zu lassen. combos, controls (Regler) und targets
+    # (Agenten) und transport (Sequencer) gelten für alle Ports.
+    __slots__ = ("base", "ports", "combos", "controls", "targets", "channels", "layers", "transport")
+
+    def __init__(self, base, ports=(), combos=(), controls=None, targets=(), channels=(), layers=(),
+                 transport=None):
+        self.base = base
+        self.ports = tuple(ports)
+        self.combos = tuple(combos)
+        self.controls = controls if controls is not None else (None,) * NOTE_SLOTS
+        self.targets = tuple(targets)
+        self.channels = tuple(channels)
+        self.layers = tuple(layers)
+        self.transport = transport if transport is not None else (None,) * len(TRANSPORT_EVENTS)
+
+    @classmethod
+    def wrap(cls, actions):
+        return actions if isinstance(actions, cls) else cls(actions)
+
+    def assigned(self):
+        tables = [self.base] + [overlay for _, overlay in self.channels]
+        for layer in self.layers:
+            tables += [layer.notes] + [overlay for _, overlay in layer.channels]
+        return sum(a is not None for table in tables for a in table)
+
+    def table_for(self, port_name):
+        if port_name is None or not self.ports:
+            return self.base
+        from ko_ports import find_port
+        table = None
+        for pattern, overlay in self.ports:
+            if find_port(pattern, [port_name]) is None:
+                continue
+            if table is None:
+                table = list(self.base)
+            for note, action in enumerate(overlay):
+                if action is not None:
+                    table[note] = action
+        return self.base if table is None else tuple(table)
+
+    def banks_for(self, port_name):
+        # Tupel flacher Tabellen: [0] ist die Basis, [i] die i-te Ebene aus [layers].
+        # Nicht belegte Tasten einer Ebene fallen auf die Basis zurück.
+        base = list(self.table_for(port_name)) * CHANNELS
+        for channel, overlay in self.channels:
+            _overlay(base, overlay, (channel,))
+        banks = [base]
+        for layer in self.layers:
+            table = list(base)
+            _overlay(table, layer.notes, range(CHANNELS))
+            for channel, overlay in layer.channels:
+                _overlay(table, overlay, (channel,))
+            banks.append(table)
+        # Die Umschalttasten wirken auf jeder Ebene und jedem Kanal.
+        for layer in self.layers:
+            for table in banks:
+                for channel in range(CHANNELS):
+                    table[channel << 7 | layer.note] = layer.switch
+        return tuple(tuple(table) for table in banks)
+
+
+def _overlay(table, overlay, channels):
+    for note, action in enumerate(overlay):
+        if action is not None:
+            for channel in channels:
+                table[channel << 7 | note] = action
+
+
+def compile_channels(sections, os_key=None, system=None):
+    # sections: {kanal 1-16: {note: eintrag}} -> Tupel (kanal 0-15, 128er-Tabelle).
+    channels = []
+    for channel, mapping in sections.items():
+        if not 1 <= channel <= CHANNELS:
+            raise ValueError(f"MIDI-Kanal {channel} liegt außerhalb von 1-{CHANNELS}")
+        channels.append((channel - 1, compile_mapping(mapping, os_key, system)))
+    return tuple(channels)
+
+
+def compile_layers(sections, os_key=None, system=None):
+    # sections: {name: {"hold"/"page": note, "notes": {...}, "channels": {...}}}
+    layers = []
+    for index, (name, section) in enumerate(sections.items(), 1):
+        modes = [mode for mode in LAYER_MODES if mode in section]
+        if len(modes) != 1:
+            raise ValueError(f"[layers.{name}]: genau eins von {', '.join(LAYER_MODES)} angeben")
+        mode = modes[0]
+        note = section[mode]
+        if not 0 <= note < NOTE_SLOTS:
+            raise ValueError(f"[layers.{name}]: Note {note} liegt außerhalb des MIDI-Bereichs 0-127")
+        switch = Action(note, f"Ebene {name}", None, None, False, f"🔀 Ebene: {name} (Note {note})",
+                        layer=LayerSwitch(mode, index))
+        layers.append(LayerSpec(name, mode, note, compile_mapping(section.get("notes", {}), os_key, system),
+                                compile_channels(section.get("channels", {}), os_key, system), switch))
+    return tuple(layers)
+
+
+def compile_ports(sections, os_key=None, system=None):
+    # sections: {muster: {note: eintrag}} -> CompiledMapping.ports, in Dateireihenfolge;
+    # passen mehrere Muster auf einen Port, gewinnt das spätere.
+    return tuple((pattern, compile_mapping(mapping, os_key, system))
+                 for pattern, mapping in sections.items())
+
+
+def compile_combos(entries, os_key=None, system=None):
+    # Jede Kombination bekommt eine eigene virtuelle Note ab 128, damit Limits, Latenzen und
+    # Zusammenfassen wie bei einzelnen Tasten funktionieren.
+    if os_key is None:
+        os_key = resolve_os_key(system)
+    combos = []
+    for index, entry in enumerate(entries):
+        kind = entry.get("type", "chord")
+        if kind not in COMBO_TYPES:
+            raise ValueError(f"Unbekannter Kombinationstyp: {kind!r}")
+        notes = tuple(entry.get("notes", ()))
+        if len(notes) < 2 or not all(isinstance(n, int) and 0 <= n < NOTE_SLOTS for n in notes):
+            raise ValueError(f"Kombination {entry.get('name')!r}: mindestens zwei MIDI-Noten nötig")
+        if kind == "chord" and (len(set(notes)) != len(notes) or len(notes) > MAX_CHORD_NOTES):
+            raise ValueError(f"Akkord {entry.get('name')!r}: 2-{MAX_CHORD_NOTES} verschiedene Noten")
+        window = float(entry.get("window", DEFAULT_COMBO_WINDOW))
+        action = compile_action(NOTE_SLOTS + index, entry, os_key, system)
+        joiner = "+" if kind == "chord" else " → "
+        _, detail = action.log_line.split("\n", 1)
+        log_line = f"🟢 Kombination: {action.name} ({joiner.join(map(str, notes))})\n{detail}"
+        combos.append(ComboSpec(kind, notes, window, action.replace(log_line=log_line)))
+    return tuple(combos)
+
+
+def compile_transport(sections, os_key=None, system=None):
+    # sections: {"start"/"continue"/"stop": eintrag} -> Tupel in der Reihenfolge von TRANSPORT_EVENTS.
+    table = [None] * len(TRANSPORT_EVENTS)
+    for event, entry in sections.items():
+        if event not in TRANSPORT_EVENTS:
+            raise ValueError(f"Unbekanntes Transport-Ereignis {event!r} ({', '.join(TRANSPORT_EVENTS)})")
+        index = TRANSPORT_EVENTS.index(event)
+        action = compile_action(TRANSPORT_BASE + index, entry, os_key, system)
+        _, detail = action.log_line.split("\n", 1)
+        table[index] = action.replace(log_line=f"▶️ Sequencer {event}: {action.name}\n{detail}")
+    return tuple(table)
+
+
+def curve_table(curve="linear", low=0, high=127, decimals=0):
+    # 128 vorberechnete Ausgabewerte; zur Laufzeit ist die Umrechnung ein Indexzugriff.
+    import math
+    if isinstance(curve, list):
+        if len(curve) != NOTE_SLOTS:
+            raise ValueError(f"Eine Kurve als Liste braucht genau {NOTE_SLOTS} Werte")
+        return tuple(curve)
+    if curve not in CC_CURVES:
+        raise ValueError(f"Unbekannte Kurve: {curve!r}")
+    values = []
+    for raw in range(NOTE_SLOTS):
+        x = raw / (NOTE_SLOTS - 1)
+        if curve == "log":
+            x = math.log1p(9 * x) / math.log(10)
+        elif curve == "exp":
+            x = math.expm1(4 * x) / math.expm1(4)
+        value = low + (high - low) * x
+        values.append(round(value, decimals) if decimals else int(round(value)))
+    return tuple(values)
+
+
+def compile_cc_mapping(mapping, os_key=None, system=None):
+    # mapping: {controller: eintrag} -> 128er-Tabelle wie bei den Noten.
+    if os_key is None:
+        os_key = resolve_os_key(system)
+    table = [None] * NOTE_SLOTS
+    for control, entry in mapping.items():
+        if not 0 <= control < NOTE_SLOTS:
+            raise ValueError(f"Controller {control} liegt außerhalb des MIDI-Bereichs 0-127")
+        action = compile_action(CC_BASE + control, entry, os_key, system)
+        values = curve_table(entry.get("curve", "linear"), entry.get("min", 0), entry.get("max", 127),
+                             entry.get("decimals", 0))
+        if action.command is None and action.native is None:
+            raise ValueError(f"Controller {control}: weder Befehl noch native Aktion")
+        spec = CcSpec(control, float(entry.get("interval", DEFAULT_CC_INTERVAL)), values,
+                      action.command, os_key)
+        table[control] = action.replace(cc=spec)
+    return tuple(table)
+
+
+def spawn(action):
+    return subprocess.Popen(action.argv, shell=action.shell)
+
+
+def execute_action(action):
+    if action.argv is None:
+        return None
+    try:
+        return spawn(action)
+    except Exception as e:
+        print(f"Fehler bei der Befehlsausführung '{action.command}': {e}")
+        return None
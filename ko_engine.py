@@ -0,0 +1,451 @@
+import asyncio
+import functools
+
+from ko_cc import CcThrottle
+from ko_coalesce import Coalescer
+from ko_combo import ComboMatcher, ComboSet
+from ko_dispatch import CC_BASE, NOTE_SLOTS, TRANSPORT_EVENTS, CompiledMapping
+from ko_latency import LatencyRecorder, now_ns
+from ko_log import SyncLog
+from ko_raw import DEFAULT_RING_SIZE, RawRing, unpack_message
+from ko_scheduler import Scheduler
+from ko_supervisor import Supervisor
+
+# Obergrenze für wartende MIDI-Nachrichten. Läuft die Queue voll, werden neue
+# Nachrichten verworfen und gezählt, statt den rtmidi-Thread zu blockieren.
+DEFAULT_QUEUE_SIZE = 256
+CLOCK = 0xF8
+
+
+class Engine:
+    def __init__(self, actions, queue_size=DEFAULT_QUEUE_SIZE, loop=None, supervisor=None,
+                 latency=None, shell_pool=None, native=None, port_names=(None,), leds=None, log=None,
+                 remote=None, processes=None, tempo=None):
+        # actions: 128er-Tabelle oder CompiledMapping. port_names[i] ist der Name von Eingang i;
+        # für jeden Eingang gibt es eine eigene Tabelle mit den passenden [ports]-Einträgen.
+        # banks[port][ebene] sind die fertigen Tabellen, tables[port] zeigt auf die aktive.
+        self.mapping = CompiledMapping.wrap(actions)
+        self.port_names = list(port_names)
+        self.banks = tuple(self.mapping.banks_for(name) for name in self.port_names)
+        self.active = [0] * len(self.port_names)
+        # Ebene vor dem Drücken einer hold-Taste; beim Loslassen geht es dorthin zurück.
+        self.before_hold = [0] * len(self.port_names)
+        self.tables = [banks[0] for banks in self.banks]
+        self.layer_switches = 0
+        self.combos = ComboSet(self.mapping.combos)
+        self.matchers = ()
+        self.supervisor = supervisor if supervisor is not None else Supervisor()
+        self.latency = latency if latency is not None else LatencyRecorder()
+        self.shell_pool = shell_pool
+        self.native = native
+        self.leds = leds
+        # Agenten auf anderen Rechnern für Einträge mit target (ko_remote.RemoteAgents).
+        self.remote = remote
+        if remote is not None:
+            remote.bind(self)
+        # Index laufender Prozesse für single_instance (ko_procs.ProcessIndex).
+        self.processes = processes
+        self.supervisor.processes = processes
+        # Tempo und Position aus der MIDI-Clock für quantize (ko_tempo.TempoTracker, --tempo).
+        self.tempo = tempo
+        self.quantized = 0
+        self.waiting = 0
+        self.skipped = 0
+        # Protokoll der Tastendrücke; EventLog schreibt im Hintergrund statt per print().
+        self.set_log(log if log is not None else SyncLog())
+        if leds is not None:
+            leds.live = self.supervisor.live_per_note
+            self.supervisor.on_change = leds.refresh
+        self.loop = loop
+        self.queue = None
+        self.queue_size = queue_size
+        self.received = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.max_depth = 0
+        # Ringpuffer je Eingang für den Rohdatenpfad (raw_feeder(), ko_raw.py).
+        self.rings = {}
+        self.coalescer = None
+        self.throttle = None
+        self.scheduler = None
+        self._tasks = set()
+
+    @property
+    def queue_depth(self):
+        return (self.queue.qsize() if self.queue is not None else 0) + sum(map(len, self.rings.values()))
+
+    @property
+    def raw_dropped(self):
+        return sum(ring.dropped for ring in self.rings.values())
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "max_depth": self.max_depth,
+            "received": self.received + self.raw_dropped,
+            "dispatched": self.dispatched,
+            "dropped": self.dropped + self.raw_dropped,
+            "children": self.supervisor.stats(),
+            "coalesce": self.coalescer.stats() if self.coalescer is not None else None,
+            "cc": self.throttle.stats() if self.throttle is not None else None,
+            "scheduler": self.scheduler.stats() if self.scheduler is not None else None,
+            "shell": self.shell_pool.stats() if self.shell_pool is not None else None,
+            "native": self.native.stats() if self.native is not None else None,
+            "leds": self.leds.stats() if self.leds is not None else None,
+            "remote": self.remote.stats() if self.remote is not None else None,
+            "processes": self.processes.stats() if self.processes is not None else None,
+            "tempo": dict(self.tempo.stats(), quantized=self.quantized, waiting=self.waiting)
+                     if self.tempo is not None else None,
+            "skipped": self.skipped,
+            "layers": {"active": list(self.active), "switches": self.layer_switches},
+            "log": self.log.stats(),
+            "combos": [m.stats() for m in self.matchers] or None,
+        }
+
+    def _led_table(self):
+        # Die LEDs zeigen die aktive Ebene von Eingang 0 auf ihrem eigenen Kanal.
+        channel = self.leds.channel
+        return self.tables[0][channel * NOTE_SLOTS:(channel + 1) * NOTE_SLOTS]
+
+    def set_log(self, log):
+        # Meldungen der Ausführenden gehen in dasselbe Protokoll, damit sie --quiet, --log-file
+        # und --log-format folgen und in der Reihenfolge der Tastendrücke erscheinen.
+        self.log = log
+        self.supervisor.log = log
+        if self.shell_pool is not None:
+            self.shell_pool.log = log
+        if self.native is not None:
+            self.native.log = log
+
+    def swap_actions(self, actions):
+        # Eine einzige Zuweisung: der Dispatcher sieht entweder die alten oder die neuen Tabellen.
+        # Aktive Ebenen bleiben aktiv, sofern es sie noch gibt.
+        mapping = CompiledMapping.wrap(actions)
+        banks = tuple(mapping.banks_for(name) for name in self.port_names)
+        active = [layer if layer < len(bank) else 0 for layer, bank in zip(self.active, banks)]
+        tables = [bank[layer] for layer, bank in zip(active, banks)]
+        # Halb erkannte Kombinationen noch mit der alten Belegung auflösen.
+        for matcher in self.matchers:
+            matcher.flush()
+        self.combos = ComboSet(mapping.combos)
+        self.mapping = mapping
+        self.before_hold = [layer if layer < len(bank) else 0 for layer, bank in zip(self.before_hold, banks)]
+        self.banks, self.active, self.tables = banks, active, tables
+        self._build_matchers()
+        if self.leds is not None:
+            self.leds.load(self._led_table())
+        if self.remote is not None and self.loop is not None:
+            self.remote.configure(mapping.targets)
+
+    def _build_matchers(self):
+        # Ein Zustandsautomat pro Eingang, damit sich Kombinationen zweier Geräte nicht mischen.
+        if self.loop is None or not self.combos:
+            self.matchers = ()
+            return
+        old = self.matchers
+        self.matchers = old[:len(self.port_names)] + tuple(
+            ComboMatcher(self.combos, self.loop, self._combo_fire(port))
+            for port in range(len(old), len(self.port_names)))
+
+    def bind(self, loop=None):
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.scheduler = Scheduler(self.loop, self.launch)
+        self.coalescer = Coalescer(self.loop, self._fire)
+        self.throttle = CcThrottle(self.loop, self._fire)
+        self._build_matchers()
+        if self.leds is not None:
+            self.leds.bind(self.loop)
+            self.leds.load(self._led_table())
+        if self.remote is not None:
+            self.remote.configure(self.mapping.targets)
+        if self.processes is not None:
+            self.processes.start(self.loop)
+
+    # Wird von rtmidi im eigenen Thread aufgerufen: nur übergeben, nie warten.
+    def feed(self, msg):
+        self.loop.call_soon_threadsafe(self._enqueue, msg, now_ns(), 0)
+
+    def feeder(self, port):
+        # Callback für Eingang Nummer port. Alle Eingänge landen in derselben Queue, in der
+        # Reihenfolge, in der ihre rtmidi-Threads die Nachrichten übergeben.
+        call_soon_threadsafe = self.loop.call_soon_threadsafe
+        enqueue = self._enqueue
+
+        def feed(msg):
+            call_soon_threadsafe(enqueue, msg, now_ns(), port)
+        return feed
+
+    def raw_feeder(self, port, size=None):
+        # Wie feeder(), aber der Callback bekommt die Bytes einer Nachricht (wie rtmidi) und legt
+        # sie nur in den Ringpuffer des Eingangs. Geweckt wird die Event-Loop einmal pro Burst.
+        # Mindestens so groß wie die Queue des mido-Pfads; ein Platz kostet nur 12 Byte, daher
+        # großzügig, damit auch lange Bursts (Controller-Fahrten, Aufnahmen) Platz haben.
+        ring = self.rings[port] = RawRing(size or max(self.queue_size, DEFAULT_RING_SIZE))
+        put = ring.put
+        call_soon_threadsafe = self.loop.call_soon_threadsafe
+        drain = functools.partial(self._drain_ring, ring, port)
+
+        def feed(data):
+            if put(data, now_ns()) and not ring.scheduled:
+                ring.scheduled = True
+                call_soon_threadsafe(drain)
+        return feed
+
+    def _drain_ring(self, ring, port):
+        # Erst den Merker löschen, dann lesen: was danach eintrifft, weckt die Loop erneut.
+        ring.scheduled = False
+        events, times, mask = ring.events, ring.times, ring.mask
+        tail, head = ring.tail, ring.head
+        if head - tail > self.max_depth:
+            self.max_depth = head - tail
+        dispatch = self.dispatch_raw
+        while tail != head:
+            i = tail & mask
+            tail += 1
+            ring.tail = tail
+            self.received += 1
+            dispatch(events[i], times[i], port)
+
+    def inject(self, msg, port=0):
+        # Für Nachrichten aus der Event-Loop selbst (z.B. ko_control.py), ohne Umweg über
+        # call_soon_threadsafe; sie laufen durch dieselbe Queue wie die vom Gerät.
+        self._enqueue(msg, now_ns(), port)
+
+    def _enqueue(self, msg, t_receive, port=0):
+        self.received += 1
+        try:
+            self.queue.put_nowait((msg, t_receive, port))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def run(self):
+        queue = self.queue
+        while True:
+            msg, t_receive, port = await queue.get()
+            try:
+                await self.handle_message(msg, t_receive, port)
+            finally:
+                queue.task_done()
+
+    async def drain(self, poll=0.001):
+        # Wartet, bis Queue, zusammengefasste Bursts und laufende Starts abgearbeitet sind.
+        await self.queue.join()
+        while (self._tasks or any(self.rings.values()) or self.coalescer.stats()["pending"] or self.throttle.stats()["active"]
+               or self.waiting or self.scheduler.pending or self.scheduler.running):
+            await asyncio.sleep(poll)
+
+    async def handle_message(self, msg, t_receive=None, port=0):
+        self.dispatch(msg, t_receive, port)
+
+    def dispatch(self, msg, t_receive=None, port=0):
+        t_dequeue = now_ns()
+        if msg.type == 'note_on' and msg.velocity > 0:
+            self._press(port, msg.channel, msg.note, t_receive, t_dequeue)
+        elif msg.type == 'control_change':
+            self._control(port, msg.control, msg.value, t_receive, t_dequeue)
+        elif msg.type in ('note_off', 'note_on'):
+            # Loslassen: Note Off oder Note On mit Velocity 0.
+            self._release(port, msg.channel, msg.note)
+        elif msg.type == 'clock':
+            # Nur ohne RtMidiInput (mido-Backend, Aufnahmen); sonst zählt der rtmidi-Thread.
+            if self.tempo is not None and self.tempo.claim(self.port_names[port]):
+                self.tempo.tick(t_receive)
+        elif msg.type in TRANSPORT_EVENTS:
+            tempo = self.tempo
+            if tempo is not None and not tempo.in_thread and tempo.claim(self.port_names[port]):
+                tempo.transport(msg.type)
+            action = self.mapping.transport[TRANSPORT_EVENTS.index(msg.type)]
+            if action is not None:
+                self.log.press(action, port)
+                self._submit(action, t_receive)
+        # Optional: Befehle auch für Note Off-Events
+        # elif msg.type == 'note_off':
+        #     action = self.tables[port][msg.channel << 7 | msg.note]
+        #     if action is not None:
+        #         print(f"⚪️ losgelassen: {action.name} (Note {msg.note})")
+        #         # Hier könnte ein "Beim Loslassen"-Befehl stehen
+
+    def _press_layer(self, port, action):
+        switch = action.layer
+        if switch.mode == "page" and self.active[port] == switch.layer:
+            self._set_layer(port, 0)
+            return
+        if switch.mode == "hold":
+            if self.active[port] == switch.layer:
+                return
+            self.before_hold[port] = self.active[port]
+        self.log.press(action, port)
+        self._set_layer(port, switch.layer)
+
+    def _set_layer(self, port, layer):
+        # Nur ein Zeiger wird umgehängt; die Tabellen aller Ebenen sind schon gebaut.
+        self.active[port] = layer
+        self.tables[port] = self.banks[port][layer]
+        self.layer_switches += 1
+        if self.leds is not None and port == 0:
+            self.leds.load(self._led_table())
+
+    def dispatch_raw(self, packed, t_receive=None, port=0):
+        # Gleiche Entscheidungen wie dispatch(), aber auf der gepackten Ganzzahl aus ko_raw.py.
+        t_dequeue = now_ns()
+        status = packed >> 16 & 0xFF
+        kind = status & 0xF0
+        if kind == 0x90 and packed & 0x7F:
+            self._press(port, status & 0x0F, packed >> 8 & 0x7F, t_receive, t_dequeue)
+        elif kind == 0xB0:
+            self._control(port, packed >> 8 & 0x7F, packed & 0x7F, t_receive, t_dequeue)
+        elif kind == 0x90 or kind == 0x80:
+            self._release(port, status & 0x0F, packed >> 8 & 0x7F)
+        elif status == CLOCK:
+            if self.tempo is not None and self.tempo.claim(self.port_names[port]):
+                self.tempo.tick(t_receive)
+        else:
+            # Selten (Transport, Program Change, ...): erst hier entsteht ein mido.Message.
+            try:
+                msg = unpack_message(packed)
+            except ValueError:
+                return
+            self.dispatch(msg, t_receive, port)
+
+    def _press(self, port, channel, note, t_receive, t_dequeue):
+        action = self.tables[port][channel << 7 | note]
+        if t_receive is not None:
+            record = self.latency.record
+            record(note, "queue", t_dequeue - t_receive)
+            record(note, "dispatch", now_ns() - t_dequeue)
+        if action is not None and action.layer is not None:
+            self._press_layer(port, action)
+        elif self.matchers and (self.combos.starts[note] or self.matchers[port].pending):
+            # Kann Teil einer Kombination sein: der Automat entscheidet, was ausgelöst wird.
+            self.matchers[port].press(note, action)
+        elif action is None:
+            self.log.unknown(note, port)
+        elif action.coalesce is not None:
+            self.coalescer.submit(action, (port, note))
+        else:
+            self.log.press(action, port)
+            self._submit(action, t_receive)
+
+    def _control(self, port, control, value, t_receive, t_dequeue):
+        # Regler ohne Eintrag in [cc] werden still ignoriert, sie senden zu viele Werte.
+        action = self.mapping.controls[control]
+        if action is not None:
+            if t_receive is not None:
+                record = self.latency.record
+                record(CC_BASE + control, "queue", t_dequeue - t_receive)
+                record(CC_BASE + control, "dispatch", now_ns() - t_dequeue)
+            self.throttle.submit(action, value, (port, control))
+
+    def _release(self, port, channel, note):
+        action = self.tables[port][channel << 7 | note]
+        if action is not None and action.layer is not None:
+            if action.layer.mode == "hold" and self.active[port] == action.layer.layer:
+                self._set_layer(port, self.before_hold[port])
+        elif self.matchers:
+            self.matchers[port].release(note)
+
+    def _submit(self, action, t_receive=None):
+        # quantize: erst zum nächsten Schlag bzw. Takt an den Scheduler; steht der Sequencer,
+        # sofort. Die Wartezeit ist gewollt und zählt daher nicht in die Latenz.
+        if action.quantize is not None and self.tempo is not None:
+            delay = self.tempo.delay_to(action.quantize)
+            if delay > 0:
+                self.quantized += 1
+                self.waiting += 1
+                self.loop.call_later(delay, self._on_beat, action)
+                return
+        self.scheduler.submit(action, t_receive)
+
+    def _on_beat(self, action):
+        self.waiting -= 1
+        self.scheduler.submit(action)
+
+    def _fire(self, action):
+        self.log.press(action)
+        self._submit(action)
+
+    def _combo_fire(self, port):
+        def fire(action, note):
+            if action is None:
+                self.log.unknown(note, port)
+            elif action.coalesce is not None:
+                self.coalescer.submit(action, (port, action.note))
+            else:
+                self._fire(action)
+        return fire
+
+    def _spawn_task(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def launch(self, action, t_receive=None):
+        if self.leds is not None:
+            self.leds.fired(action)
+        if action.target is not None:
+            if self.remote is not None:
+                self.remote.submit(action, t_receive)
+            return None
+        if action.native is not None and self.native is not None:
+            # D-Bus-Antworten abwarten darf den Dispatcher nicht aufhalten.
+            self._spawn_task(self._launch_native(action, t_receive))
+            return None
+        return await self._launch_command(action, t_receive)
+
+    async def _launch_native(self, action, t_receive):
+        t_start = now_ns()
+        if not await self.native.run(action.native):
+            await self._launch_command(action, t_receive)
+            return
+        t_done = now_ns()
+        self.dispatched += 1
+        self.latency.record(action.note, "spawn", t_done - t_start)
+        if t_receive is not None:
+            self.latency.record(action.note, "total", t_done - t_receive)
+
+    async def _already_running(self, action, pid):
+        spec = action.single_instance
+        self.skipped += 1
+        if spec.focus is None:
+            self.log.message(f"↩️ {action.name} läuft bereits (PID {pid}), nicht erneut gestartet")
+            return None
+        self.log.message(f"↩️ {action.name} läuft bereits (PID {pid}), hole es nach vorne")
+        focus = action.replace(command=spec.focus, argv=spec.focus_argv, shell=spec.focus_shell,
+                               single_instance=None)
+        return await self.supervisor.spawn(focus)
+
+    def remote_started(self, action, t_receive, spawn_ns):
+        # Der Agent meldet den laufenden Prozess; spawn ist hier die Zeit vom Senden bis dahin.
+        t_done = now_ns()
+        self.dispatched += 1
+        self.latency.record(action.note, "spawn", spawn_ns)
+        if t_receive is not None:
+            self.latency.record(action.note, "total", t_done - t_receive)
+
+    async def _launch_command(self, action, t_receive=None):
+        if action.argv is None:
+            return None
+        if action.single_instance is not None and self.processes is not None:
+            pid = self.processes.find(action.single_instance.names)
+            if pid is not None:
+                return await self._already_running(action, pid)
+        t_spawn = now_ns()
+        if action.executor == "shell" and self.shell_pool is not None and self.shell_pool.submit(action):
+            # Übergabe an die warme Shell; das Ergebnis wertet der Pool im Hintergrund aus.
+            self.dispatched += 1
+            self.latency.record(action.note, "spawn", now_ns() - t_spawn)
+            return None
+        proc = await self.supervisor.spawn(action)
+        if proc is not None:
+            # create_subprocess_* kehrt erst zurück, wenn exec() im Kind gelungen ist.
+            t_running = now_ns()
+            self.dispatched += 1
+            self.latency.record(action.note, "spawn", t_running - t_spawn)
+            if t_receive is not None:
+                self.latency.record(action.note, "total", t_running - t_receive)
+        return proc
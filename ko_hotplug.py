@@ -0,0 +1,157 @@
+import asyncio
+import sys
+import time
+
+from ko_latency import format_ns
+from ko_ports import find_port, get_input_names, open_input as open_midi_input
+
+# Solange alle Eingänge verbunden sind, wird nur selten nachgesehen, ob sie noch da sind.
+# Unter Linux meldet inotify auf /dev/snd das Ab- und Anstecken zusätzlich sofort.
+CHECK_INTERVAL = 5.0
+# Wartezeiten, solange ein Eingang fehlt: Beginn, Faktor, Obergrenze.
+BACKOFF_START = 0.25
+BACKOFF_FACTOR = 2.0
+BACKOFF_MAX = 5.0
+# Nach einem Gerätereignis braucht der ALSA-Sequencer einen Moment, bis der Port sichtbar ist.
+SETTLE_DELAY = 0.1
+DEVICE_DIR = "/dev/snd"
+
+
+class PortManager:
+    # Öffnet die Eingänge, bemerkt verschwundene Ports und öffnet sie wieder, sobald das Gerät
+    # zurück ist. Jeder Eingang behält seinen Index und damit seinen Callback: Tabellen,
+    # Queue und Statistiken der Engine bleiben über das Wiederverbinden hinweg erhalten.
+    def __init__(self, engine, callbacks, open_input=open_midi_input, list_inputs=get_input_names,
+                 check_interval=CHECK_INTERVAL):
+        self.engine = engine
+        self.callbacks = list(callbacks)
+        self.open_input = open_input
+        self.list_inputs = list_inputs
+        self.check_interval = check_interval
+        self.names = list(engine.port_names)
+        self.ports = [None] * len(self.callbacks)
+        self.lost_at = [None] * len(self.callbacks)
+        self.mode = None
+        self.checks = 0
+        self.disconnects = 0
+        self.reconnects = 0
+        self.failed = 0
+        self.last_outage_ns = None
+        self.last_open_ns = None
+        self._inotify = None
+        self._task = None
+        self._wake = None
+
+    def open_all(self):
+        try:
+            for i, (name, callback) in enumerate(zip(self.names, self.callbacks)):
+                self.ports[i] = self.open_input(name, callback=callback)
+        except Exception:
+            self.close()
+            raise
+        return list(self.ports)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "connected": sum(1 for port in self.ports if port is not None),
+            "checks": self.checks,
+            "disconnects": self.disconnects,
+            "reconnects": self.reconnects,
+            "failed": self.failed,
+            "last_outage_ns": self.last_outage_ns,
+            "last_open_ns": self.last_open_ns,
+        }
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.mode = "poll"
+        if sys.platform.startswith("linux"):
+            try:
+                from ko_mapping import Inotify
+                mask = Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_MOVED_FROM | Inotify.IN_MOVED_TO
+                self._inotify = Inotify(DEVICE_DIR, mask)
+                loop.add_reader(self._inotify.fd, self._on_inotify)
+                self.mode = "inotify"
+            except (OSError, AttributeError, TypeError):
+                self._inotify = None
+        self._task = loop.create_task(self._run())
+
+    def _on_inotify(self):
+        if self._inotify.read_names():
+            self._wake.set()
+
+    async def _run(self):
+        delay = self.check_interval
+        backoff = None
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+                self._wake.clear()
+                # Mehrere Ereignisse eines Ansteckens zu einer Prüfung zusammenfassen.
+                await asyncio.sleep(SETTLE_DELAY)
+                self._wake.clear()
+            except asyncio.TimeoutError:
+                pass
+            if not await self.check():
+                backoff = None
+                delay = self.check_interval
+            else:
+                backoff = BACKOFF_START if backoff is None else min(backoff * BACKOFF_FACTOR, BACKOFF_MAX)
+                delay = backoff
+
+    async def check(self):
+        # Liefert die Zahl der Eingänge, die weiterhin fehlen. Das Auflisten der Ports läuft
+        # in einem Thread, damit der Dispatcher nicht auf rtmidi wartet.
+        self.checks += 1
+        available = await asyncio.get_running_loop().run_in_executor(None, self.list_inputs)
+        missing = 0
+        for i, name in enumerate(self.names):
+            current = find_port(name, available)
+            if self.ports[i] is not None and current is None:
+                self._lost(i)
+            if self.ports[i] is None and (current is None or not self._reopen(i, current)):
+                missing += 1
+        return missing
+
+    def _lost(self, i):
+        port, self.ports[i] = self.ports[i], None
+        self.lost_at[i] = time.perf_counter_ns()
+        self.disconnects += 1
+        print(f"🔌 Verbindung zu {self.names[i]} verloren, warte auf das Gerät ...")
+        try:
+            port.close()
+        except Exception:
+            pass
+
+    def _reopen(self, i, name):
+        t_open = time.perf_counter_ns()
+        try:
+            port = self.open_input(name, callback=self.callbacks[i])
+        except Exception as e:
+            self.failed += 1
+            print(f"Port {name} konnte nicht geöffnet werden: {e}")
+            return False
+        t_done = time.perf_counter_ns()
+        self.ports[i] = port
+        self.names[i] = name
+        self.reconnects += 1
+        self.last_open_ns = t_done - t_open
+        self.last_outage_ns = t_done - self.lost_at[i] if self.lost_at[i] is not None else None
+        outage = format_ns(self.last_outage_ns) if self.last_outage_ns is not None else "?"
+        print(f"🔌 Wieder verbunden mit {name} nach {outage} (Öffnen {format_ns(self.last_open_ns)})")
+        return True
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        for i, port in enumerate(self.ports):
+            if port is not None:
+                self.ports[i] = None
+                port.close()
@@ -0,0 +1,91 @@
+import bisect
+import time
+
+from ko_dispatch import slot_label
+
+now_ns = time.perf_counter_ns
+
+# Feste, logarithmische Bucket-Grenzen (vier pro Verdopplung) von 1 µs bis ca. 70 s.
+# Damit bleibt der Speicher pro Histogramm konstant, egal wie lange das Programm läuft.
+BUCKET_BOUNDS_NS = tuple(int(1000 * 2 ** (i / 4)) for i in range(105))
+
+# queue:    rtmidi-Callback bis der Dispatcher die Nachricht aus der Queue nimmt
+# dispatch: Auswertung der Nachricht und Lookup in der Tabelle
+# spawn:    Prozessstart bis exec() im Kind bestätigt ist
+# total:    rtmidi-Callback bis der Kindprozess läuft
+STAGES = ("queue", "dispatch", "spawn", "total")
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+        self.count = 0
+        self.max = 0
+
+    def record(self, ns):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_NS, ns)] += 1
+        self.count += 1
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = self.count * p / 100
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                # Obergrenze des Buckets, aber nie mehr als der gemessene Höchstwert.
+                if index < len(BUCKET_BOUNDS_NS):
+                    return min(BUCKET_BOUNDS_NS[index], self.max)
+                return self.max
+        return self.max
+
+
+def format_ns(ns):
+    if ns >= 1_000_000_000:
+        return f"{ns / 1e9:.2f}s"
+    if ns >= 1_000_000:
+        return f"{ns / 1e6:.2f}ms"
+    return f"{ns / 1e3:.1f}µs"
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.overall = {stage: Histogram() for stage in STAGES}
+        self.per_note = {}
+
+    def record(self, note, stage, ns):
+        self.overall[stage].record(ns)
+        histograms = self.per_note.get(note)
+        if histograms is None:
+            histograms = self.per_note[note] = {s: Histogram() for s in STAGES}
+        histograms[stage].record(ns)
+
+    def summary(self, histograms=None):
+        histograms = self.overall if histograms is None else histograms
+        return {
+            stage: {f"p{p}": h.percentile(p) for p in PERCENTILES} | {"count": h.count, "max": h.max}
+            for stage, h in histograms.items()
+        }
+
+    def report(self, per_note=True):
+        lines = ["Latenzen (p50 / p95 / p99 / max):"]
+        lines += self._format_block("Gesamt", self.overall)
+        if per_note:
+            for note in sorted(self.per_note):
+                lines += self._format_block(slot_label(note), self.per_note[note])
+        return "\n".join(lines)
+
+    def _format_block(self, title, histograms):
+        lines = [f"  {title}:"]
+        for stage, h in histograms.items():
+            if not h.count:
+                continue
+            values = " / ".join(format_ns(h.percentile(p)) for p in PERCENTILES)
+            lines.append(f"    {stage:<9}{values} / {format_ns(h.max)}  (n={h.count})")
+        return lines
@@ -0,0 +1,168 @@
+from ko_dispatch import NOTE_SLOTS, LedSpec
+
+# Obergrenze für Bildwechsel pro Sekunde; dazwischen werden Änderungen nur gesammelt.
+DEFAULT_FPS = 30
+# Höchstens so viele Nachrichten pro Bild, der Rest folgt im nächsten Bild.
+MAX_PER_FLUSH = 64
+# So lange leuchtet eine Taste nach dem Drücken mindestens (auch ohne laufenden Prozess).
+FLASH_TIME = 0.15
+# Bildpuffer: Plätze 0-127 sind Noten, 128-255 Controller (CC).
+SLOTS = 2 * NOTE_SLOTS
+_UNKNOWN = 0xFF
+
+
+def led_spec(action):
+    # Ohne eigenen mode: Umschalter (Toggle-Coalesce, Stummschalten) merken ihren Zustand,
+    # alles andere zeigt laufende Prozesse an.
+    spec = action.led or LedSpec(None, 127, 0, None)
+    if spec.mode is not None:
+        return spec
+    toggles = (action.coalesce is not None and action.coalesce.mode == "toggle"
+               or action.native is not None and action.native.action.endswith("toggle_mute"))
+    return spec._replace(mode="toggle" if toggles else "running")
+
+
+class MemoryOutput:
+    # MIDI-Ausgang im Speicher, z.B. zum Prüfen der LED-Ausgabe ohne Gerät.
+    def __init__(self, name="memory"):
+        self.name = name
+        self.messages = []
+        self.closed = False
+
+    def send(self, msg):
+        self.messages.append(msg)
+
+    def close(self):
+        self.closed = True
+
+
+class LedFeedback:
+    # Spiegelt den Zustand der Aktionen als Note-/CC-Nachrichten auf das Gerät zurück.
+    # Änderungen landen nur im Bildpuffer; ein Timer schickt höchstens fps-mal pro Sekunde
+    # die Plätze, die sich seit dem letzten Bild wirklich geändert haben. Ein an/aus
+    # innerhalb eines Bildes erzeugt so gar keine Nachricht.
+    def __init__(self, output, fps=DEFAULT_FPS, channel=0, live=None, max_per_flush=MAX_PER_FLUSH):
+        self.output = output
+        self.interval = 1.0 / fps
+        self.channel = channel
+        self.live = live if live is not None else {}
+        self.max_per_flush = max_per_flush
+        self.loop = None
+        self.frame = bytearray(SLOTS)
+        self.shown = bytearray([_UNKNOWN]) * SLOTS
+        self.specs = {}
+        self.toggled = set()
+        self.sent = 0
+        self.flushes = 0
+        self.failed = 0
+        self._dirty = set()
+        self._handle = None
+        self._next_flush = 0.0
+
+    def stats(self):
+        return {"sent": self.sent, "flushes": self.flushes, "failed": self.failed,
+                "pending": len(self._dirty)}
+
+    def bind(self, loop):
+        self.loop = loop
+
+    def load(self, table):
+        # Nach Start oder Neuladen: Zuordnung Note -> LED neu aufbauen, Umschaltzustände bleiben.
+        specs = {}
+        for action in table:
+            if action is None:
+                continue
+            spec = led_spec(action)
+            if spec.mode != "off":
+                specs[action.note] = spec
+        for note, spec in self.specs.items():
+            if specs.get(note) != spec:
+                self._set(self._slot(spec, note), spec.off)
+        self.specs = specs
+        for note in specs:
+            self.refresh(note)
+
+    @staticmethod
+    def _slot(spec, note):
+        return NOTE_SLOTS + spec.cc if spec.cc is not None else note
+
+    def _set(self, slot, value):
+        if self.frame[slot] == value and slot not in self._dirty and self.shown[slot] == value:
+            return
+        self.frame[slot] = value
+        self._dirty.add(slot)
+        if self._handle is None and self.loop is not None:
+            delay = max(0.0, self._next_flush - self.loop.time())
+            self._handle = self.loop.call_later(delay, self.flush)
+
+    def refresh(self, note, flash=False):
+        spec = self.specs.get(note)
+        if spec is None:
+            return
+        if spec.mode == "toggle":
+            lit = note in self.toggled
+        else:
+            lit = flash or self.live.get(note, 0) > 0
+        self._set(self._slot(spec, note), spec.on if lit else spec.off)
+
+    def fired(self, action):
+        note = action.note
+        spec = self.specs.get(note)
+        if spec is None:
+            return
+        if spec.mode == "toggle":
+            self.toggled.symmetric_difference_update((note,))
+            self.refresh(note)
+        else:
+            # Kurz aufleuchten; danach entscheidet, ob noch ein Prozess der Taste läuft.
+            self.refresh(note, flash=True)
+            if self.loop is not None:
+                self.loop.call_later(FLASH_TIME, self.refresh, note)
+
+    def flush(self):
+        self._handle = None
+        if self.loop is not None:
+            self._next_flush = self.loop.time() + self.interval
+        if not self._dirty:
+            return
+        import mido
+        frame, shown, channel = self.frame, self.shown, self.channel
+        budget = self.max_per_flush
+        for slot in sorted(self._dirty):
+            if budget == 0:
+                break
+            self._dirty.discard(slot)
+            value = frame[slot]
+            if shown[slot] == value:
+                continue
+            if slot < NOTE_SLOTS:
+                msg = mido.Message("note_on", channel=channel, note=slot, velocity=value)
+            else:
+                msg = mido.Message("control_change", channel=channel, control=slot - NOTE_SLOTS, value=value)
+            try:
+                self.output.send(msg)
+            except Exception as e:
+                # Gerät weg oder Puffer voll: beim nächsten Bild erneut versuchen.
+                self.failed += 1
+                self._dirty.add(slot)
+                if self.failed % 100 == 1:
+                    print(f"LED-Ausgabe fehlgeschlagen: {e}")
+                break
+            shown[slot] = value
+            self.sent += 1
+            budget -= 1
+        self.flushes += 1
+        if self._dirty and self._handle is None and self.loop is not None:
+            self._handle = self.loop.call_later(self.interval, self.flush)
+
+    def close(self):
+        # Alle LEDs ausschalten, damit das Gerät keinen veralteten Zustand zeigt.
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self.loop = None
+        for note, spec in self.specs.items():
+            self._set(self._slot(spec, note), spec.off)
+        self.max_per_flush = SLOTS
+        self.flush()
+        self.output.close()
@@ -0,0 +1,175 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# Obergrenze für noch nicht geschriebene Einträge; darüber wird verworfen und gezählt.
+DEFAULT_QUEUE_SIZE = 4096
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUPS = 3
+LOG_FORMATS = ("text", "json")
+
+
+def format_text(record):
+    _, kind, port, item = record
+    if kind == "press":
+        return item.log_line
+    if kind == "unknown":
+        return f"🟢 gedrückt: Unbekannt (Note {item})"
+    return str(item)
+
+
+def format_stamped(record):
+    # Textformat für die Datei: jede Zeile mit der Zeit des Tastendrucks.
+    ns = record[0]
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ns // 1_000_000_000))
+    stamp = f"{stamp}.{ns // 1_000_000 % 1000:03d}"
+    return "\n".join(f"{stamp} {line}" for line in format_text(record).split("\n"))
+
+
+def format_json(record):
+    ns, kind, port, item = record
+    entry = {"ts": round(ns / 1e9, 6), "event": kind, "port": port}
+    if kind == "press":
+        entry.update(note=item.note, name=item.name, command=item.command)
+        if item.native is not None:
+            entry["native"] = item.native.action
+    elif kind == "unknown":
+        entry["note"] = item
+    else:
+        entry["text"] = str(item)
+    return json.dumps(entry, ensure_ascii=False)
+
+
+class RotatingFile:
+    # Hängt an path an; wird max_bytes überschritten, rückt path -> path.1 -> ... -> path.N.
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+
+    def write(self, text):
+        size = len(text.encode("utf-8"))
+        if self.max_bytes and self._size and self._size + size > self.max_bytes:
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+        self._size += size
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+
+class SyncLog:
+    # Schreibt sofort per print(); Standard, wenn kein EventLog übergeben wird.
+    def press(self, action, port=0):
+        print(action.log_line)
+
+    def unknown(self, note, port=0):
+        print(f"🟢 gedrückt: Unbekannt (Note {note})")
+
+    def message(self, text, port=None):
+        print(text)
+
+    def stats(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class EventLog:
+    # Der Dispatcher legt nur ein Tupel (Zeit, Art, Port, Action/Note) in eine Deque; ein
+    # eigener Thread formatiert gesammelt und schreibt in Konsole und/oder Datei. Ein
+    # langsames Terminal oder eine volle Pipe bremst so nie das Starten der Befehle.
+    def __init__(self, console=True, path=None, fmt="text", max_bytes=DEFAULT_MAX_BYTES,
+                 backups=DEFAULT_BACKUPS, queue_size=DEFAULT_QUEUE_SIZE, stream=None):
+        if fmt not in LOG_FORMATS:
+            raise ValueError(f"Unbekanntes Log-Format: {fmt!r}")
+        self.console = console
+        # stream=None: das jeweils aktuelle sys.stdout (z.B. der Log der Oberfläche).
+        self.stream = stream
+        self.format = format_json if fmt == "json" else format_text
+        self.file_format = format_json if fmt == "json" else format_stamped
+        self.file = RotatingFile(path, max_bytes, backups) if path else None
+        self.queue_size = queue_size
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed = 0
+        self._records = deque()
+        self._wake = threading.Event()
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        return {"pending": len(self._records), "written": self.written, "dropped": self.dropped,
+                "batches": self.batches, "failed": self.failed}
+
+    def _put(self, record):
+        if len(self._records) >= self.queue_size:
+            self.dropped += 1
+            return
+        self._records.append(record)
+        if not self._wake.is_set():
+            self._wake.set()
+
+    def press(self, action, port=0):
+        self._put((time.time_ns(), "press", port, action))
+
+    def unknown(self, note, port=0):
+        self._put((time.time_ns(), "unknown", port, note))
+
+    def message(self, text, port=None):
+        self._put((time.time_ns(), "message", port, text))
+
+    def _run(self):
+        records = self._records
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            batch = []
+            while records:
+                batch.append(records.popleft())
+            if batch:
+                self._write(batch)
+            if self._closing and not records:
+                return
+
+    def _write(self, batch):
+        try:
+            if self.console:
+                stream = self.stream if self.stream is not None else sys.stdout
+                stream.write("".join(self.format(record) + "\n" for record in batch))
+                stream.flush()
+            if self.file is not None:
+                self.file.write("".join(self.file_format(record) + "\n" for record in batch))
+        except (OSError, ValueError) as e:
+            self.failed += len(batch)
+            print(f"Log konnte nicht geschrieben werden: {e}", file=sys.stderr)
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def close(self):
+        # Restliche Einträge noch schreiben, dann den Thread beenden.
+        self._closing = True
+        self._wake.set()
+        self._thread.join()
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import struct
+import sys
+
+from ko_dispatch import (LAYER_MODES, Action, CompiledMapping, compile_cc_mapping, compile_channels,
+                         compile_combos, compile_layers, compile_mapping, compile_ports, compile_targets,
+                         compile_transport, resolve_os_key)
+
+DEFAULT_MAPPING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapping.toml")
+# Bei Änderungen am kompilierten Format erhöhen, damit alte Cache-Dateien ignoriert werden.
+CACHE_VERSION = 8
+POLL_INTERVAL = 1.0
+
+
+def default_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "ko2-midi-commander")
+
+
+def _load_toml(text):
+    # Erst hier importieren: bei einem Cache-Treffer wird gar nicht geparst.
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise RuntimeError("Für TOML-Mappings wird Python 3.11+ oder das Paket tomli benötigt")
+    return tomllib.loads(text)
+
+
+def _note_keys(raw, path):
+    try:
+        return {int(note): entry for note, entry in raw.items()}
+    except ValueError as e:
+        raise ValueError(f"{path}: Schlüssel müssen MIDI-Noten sein ({e})")
+
+
+def _section(raw, key, path, hint):
+    section = raw.pop(key, {})
+    if not isinstance(section, dict):
+        raise ValueError(f"{path}: '{key}' muss eine Tabelle sein ({hint})")
+    return section
+
+
+def _channel_keys(raw, path):
+    # [channels.KANAL.NOTE] -> {kanal: {note: eintrag}}
+    return {channel: _note_keys(notes, f"{path} [channels.{channel}]")
+            for channel, notes in _note_keys(raw, f"{path} [channels]").items()}
+
+
+def _parse_layers(sections, path):
+    layers = {}
+    for name, section in sections.items():
+        section = dict(section)
+        where = f"{path} [layers.{name}]"
+        layer = {mode: section.pop(mode) for mode in LAYER_MODES if mode in section}
+        layer["channels"] = _channel_keys(_section(section, "channels", where, "[layers.NAME.channels.KANAL]"), where)
+        layer["notes"] = _note_keys(section, where)
+        layers[name] = layer
+    return layers
+
+
+def parse_document(data, path):
+    # Liefert (noten, ports, combos, regler, ziele, kanäle, ebenen, transport): noten gilt für alle
+    # Eingänge, ports = {muster: noten} nur für Eingänge, deren Name zum Muster passt (gleiche
+    # Regeln wie bei --port), combos ist die Liste der [[combos]]-Einträge, regler =
+    # {controller: eintrag} aus den [cc.N]-Abschnitten, ziele = {name: agent} aus den
+    # [targets.NAME]-Abschnitten, kanäle = {kanal: noten} aus [channels.KANAL] und ebenen =
+    # {name: {hold/page, notes, channels}} aus [layers.NAME] und transport = {ereignis: eintrag}
+    # aus [transport.start|continue|stop].
+    if path.endswith(".json"):
+        import json
+        raw = json.loads(data)
+    else:
+        raw = _load_toml(data.decode("utf-8"))
+    sections = _section(raw, "ports", path, '[ports."MUSTER"]')
+    ports = {pattern: _note_keys(notes, f"{path} [ports.{pattern}]") for pattern, notes in sections.items()}
+    combos = raw.pop("combos", [])
+    if not isinstance(combos, list):
+        raise ValueError(f"{path}: 'combos' muss eine Liste sein ([[combos]])")
+    controls = _note_keys(_section(raw, "cc", path, "[cc.NUMMER]"), f"{path} [cc]")
+    targets = _section(raw, "targets", path, "[targets.NAME]")
+    channels = _channel_keys(_section(raw, "channels", path, "[channels.KANAL]"), path)
+    layers = _parse_layers(_section(raw, "layers", path, "[layers.NAME]"), path)
+    transport = _section(raw, "transport", path, "[transport.start]")
+    return _note_keys(raw, path), ports, combos, controls, targets, channels, layers, transport
+
+
+def parse_mapping(data, path):
+    return parse_document(data, path)[0]
+
+
+def load_mapping(path=DEFAULT_MAPPING_PATH):
+    with open(path, "rb") as f:
+        return parse_mapping(f.read(), path)
+
+
+def load_compiled(path=DEFAULT_MAPPING_PATH, os_key=None, cache_dir=None):
+    # Liefert (CompiledMapping, Hash). Der Cache ist über den Dateiinhalt und das Ziel-OS adressiert:
+    # bei unverändertem Mapping entfällt das Parsen und Kompilieren komplett.
+    os_key = resolve_os_key() if os_key is None else os_key
+    with open(path, "rb") as f:
+        data = f.read()
+    fields = ",".join(Action.__slots__)
+    digest = hashlib.sha256(data + f"\0{os_key}\0{CACHE_VERSION}\0{fields}".encode()).hexdigest()
+    cache_dir = default_cache_dir() if cache_dir is None else cache_dir
+    cache_path = os.path.join(cache_dir, f"{digest}.pickle") if cache_dir else None
+    if cache_path is not None:
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f), digest
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            pass
+    notes, ports, combos, controls, targets, channels, layers, transport = parse_document(data, path)
+    compiled = CompiledMapping(compile_mapping(notes, os_key=os_key), compile_ports(ports, os_key=os_key),
+                               compile_combos(combos, os_key=os_key),
+                               compile_cc_mapping(controls, os_key=os_key), compile_targets(targets),
+                               compile_channels(channels, os_key=os_key), compile_layers(layers, os_key=os_key),
+                               compile_transport(transport, os_key=os_key))
+    if cache_path is not None:
+        _write_cache(cache_path, compiled)
+    return compiled, digest
+
+
+async def reload_mapping(engine, path, digest=None, os_key=None, cache_dir=None, source=None):
+    # Parsen, Kompilieren und Cache-Schreiben laufen in einem Thread, nur der Tausch der Tabellen
+    # in der Event-Loop: ein Neuladen hält die MIDI-Verarbeitung nicht auf. Liefert den neuen
+    # Hash oder None, wenn sich nichts geändert hat; Fehler gehen an den Aufrufer.
+    compiled, new_digest = await asyncio.get_running_loop().run_in_executor(
+        None, load_compiled, path, os_key, cache_dir)
+    if new_digest == digest:
+        return None
+    engine.swap_actions(compiled)
+    suffix = f" ({source})" if source else ""
+    engine.log.message(f"🔄 Mapping neu geladen{suffix}: {compiled.assigned()} Tasten belegt")
+    return new_digest
+
+
+def _write_cache(cache_path, compiled):
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(compiled, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        print(f"Mapping-Cache konnte nicht geschrieben werden: {e}")
+
+
+class Inotify:
+    # Minimaler inotify-Zugriff über ctypes, damit keine Zusatzpakete nötig sind.
+    # ctypes wird erst beim Start des Watchers importiert, nicht beim Programmstart.
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT = struct.Struct("iIII")
+
+    # Standard: Dateien, die im Verzeichnis fertig geschrieben oder neu angelegt werden.
+    FILE_CHANGES = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, directory, mask=FILE_CHANGES):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+
+    def read_names(self):
+        names = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class MappingWatcher:
+    # Beobachtet die Mapping-Datei (inotify, sonst stat-Polling) und lädt bei einer gültigen
+    # Änderung die Belegung von engine neu (reload_mapping). Fehlerhafte Dateien werden
+    # gemeldet, die alte Tabelle bleibt dann aktiv.
+    def __init__(self, path, engine=None, os_key=None, cache_dir=None, poll_interval=POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.engine = engine
+        self.os_key = os_key
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self.digest = None
+        self.reloads = 0
+        self.errors = 0
+        self.mode = None
+        self._inotify = None
+        self._poll_task = None
+        self._pending = None
+        self._reloading = None
+        self._again = False
+        self._stat = None
+
+    def start(self, digest=None):
+        self.digest = digest
+        loop = asyncio.get_running_loop()
+        if sys.platform.startswith("linux"):
+            try:
+                # Das Verzeichnis beobachten: Editoren ersetzen Dateien oft per rename.
+                self._inotify = Inotify(os.path.dirname(self.path))
+                loop.add_reader(self._inotify.fd, self._on_inotify)
+                self.mode = "inotify"
+                return
+            except (OSError, AttributeError, TypeError):
+                self._inotify = None
+        self._stat = self._stat_key()
+        self._poll_task = loop.create_task(self._poll())
+        self.mode = "poll"
+
+    def _on_inotify(self):
+        if os.path.basename(self.path) in self._inotify.read_names():
+            # Mehrere Events eines Speichervorgangs zu einem Neuladen zusammenfassen.
+            if self._pending is not None:
+                self._pending.cancel()
+            self._pending = asyncio.get_running_loop().call_later(0.05, self._schedule)
+
+    def _schedule(self):
+        self._pending = None
+        if self._reloading is not None:
+            # Läuft gerade ein Neuladen, danach noch einmal mit dem neuesten Stand.
+            self._again = True
+            return
+        self._reloading = asyncio.get_running_loop().create_task(self._reload_pending())
+
+    async def _reload_pending(self):
+        try:
+            await self.reload()
+            while self._again:
+                self._again = False
+                await self.reload()
+        finally:
+            self._reloading = None
+
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            key = self._stat_key()
+            if key != self._stat:
+                self._stat = key
+                await self.reload()
+
+    async def reload(self):
+        try:
+            digest = await reload_mapping(self.engine, self.path, self.digest, self.os_key, self.cache_dir)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            self.errors += 1
+            self.engine.log.message(f"⚠️ Mapping {self.path} ungültig, alte Belegung bleibt aktiv: {e}")
+            return
+        if digest is not None:
+            self.digest = digest
+            self.reloads += 1
+
+    def close(self):
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._reloading is not None:
+            self._reloading.cancel()
+            self._reloading = None
@@ -0,0 +1,153 @@
+import sys
+import time
+
+from ko_log import SyncLog
+
+# Native Aktionen laufen ohne eigenen Prozess über eine dauerhaft offene D-Bus-Verbindung
+# (jeepney) und zwischengespeicherte ALSA-Mixer (pyalsaaudio). Beide Pakete sind optional:
+# fehlen sie oder ist kein Session-Bus erreichbar, startet der Aufrufer den Shell-Befehl.
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+MPRIS_PLAYER = "org.mpris.MediaPlayer2.Player"
+MPRIS_METHODS = {
+    "mpris.next": "Next",
+    "mpris.previous": "Previous",
+    "mpris.play_pause": "PlayPause",
+}
+# Nach einem Verbindungsfehler wird so lange direkt der Ersatzbefehl genutzt.
+RETRY_INTERVAL = 5.0
+
+
+class NativeUnavailable(Exception):
+    pass
+
+
+class NativeActions:
+    def __init__(self, bus="SESSION"):
+        self.bus = bus
+        self.handled = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self._router = None
+        self._conn = None
+        self._mixers = {}
+        self._unavailable_until = {}
+        # Wie Supervisor.log.
+        self.log = SyncLog()
+
+    @staticmethod
+    def supported():
+        return sys.platform.startswith("linux")
+
+    def stats(self):
+        return {"handled": self.handled, "failed": self.failed, "fallbacks": self.fallbacks}
+
+    async def run(self, spec):
+        # True: erledigt (auch wenn die Gegenseite einen Fehler meldet), False: Ersatzbefehl nutzen.
+        kind = spec.action.split(".", 1)[0]
+        if time.monotonic() < self._unavailable_until.get(kind, 0):
+            self.fallbacks += 1
+            return False
+        try:
+            if kind == "mpris":
+                await self._mpris(spec)
+            elif spec.action == "volume.step":
+                self._volume_step(spec)
+            elif spec.action == "volume.set":
+                self._volume_set(spec)
+            else:
+                self._toggle_mute(spec)
+        except NativeUnavailable as e:
+            self._unavailable_until[kind] = time.monotonic() + RETRY_INTERVAL
+            self.fallbacks += 1
+            self.log.message(f"Native Aktion {spec.action} nicht verfügbar ({e}), nutze Befehl")
+            return False
+        except Exception as e:
+            self.failed += 1
+            self.log.message(f"Fehler bei nativer Aktion {spec.action}: {e}")
+            return True
+        self.handled += 1
+        return True
+
+    async def _get_router(self):
+        if self._router is not None:
+            return self._router
+        try:
+            from jeepney.io.asyncio import DBusRouter, open_dbus_connection
+        except ImportError:
+            raise NativeUnavailable("jeepney ist nicht installiert")
+        try:
+            self._conn = await open_dbus_connection(self.bus)
+        except (OSError, KeyError) as e:
+            raise NativeUnavailable(f"kein D-Bus: {e}")
+        self._router = DBusRouter(self._conn)
+        await self._router.__aenter__()
+        return self._router
+
+    async def _mpris(self, spec):
+        from jeepney import DBusAddress, MessageType, new_method_call
+        from jeepney.io.asyncio import RouterClosed
+
+        address = DBusAddress(MPRIS_PATH, bus_name=f"org.mpris.MediaPlayer2.{spec.player}",
+                              interface=MPRIS_PLAYER)
+        message = new_method_call(address, MPRIS_METHODS[spec.action])
+        for attempt in range(2):
+            router = await self._get_router()
+            try:
+                reply = await router.send_and_get_reply(message)
+                break
+            except (RouterClosed, ConnectionError, OSError):
+                # Verbindung ist weg (z.B. Neustart der Session): einmal neu verbinden.
+                await self._close_router()
+                if attempt:
+                    raise NativeUnavailable("D-Bus-Verbindung verloren")
+        if reply.header.message_type == MessageType.error:
+            raise RuntimeError(f"{spec.player}: {reply.body[0] if reply.body else 'D-Bus-Fehler'}")
+
+    def _mixer(self, spec):
+        key = (spec.device, spec.control)
+        mixer = self._mixers.get(key)
+        if mixer is None:
+            try:
+                import alsaaudio
+            except ImportError:
+                raise NativeUnavailable("pyalsaaudio ist nicht installiert")
+            try:
+                mixer = self._mixers[key] = alsaaudio.Mixer(control=spec.control, device=spec.device)
+            except alsaaudio.ALSAAudioError as e:
+                raise NativeUnavailable(f"Mixer {spec.device}/{spec.control}: {e}")
+        elif hasattr(mixer, "handleevents"):
+            # Änderungen anderer Programme übernehmen, bevor wir relativ verstellen.
+            mixer.handleevents()
+        return mixer
+
+    def _volume_step(self, spec):
+        mixer = self._mixer(spec)
+        volumes = mixer.getvolume()
+        current = sum(volumes) // len(volumes)
+        mixer.setvolume(max(0, min(100, current + spec.delta)))
+
+    def _volume_set(self, spec):
+        # Absoluter Wert vom Regler (ko_cc.py), Kurve und Bereich kommen aus dem Mapping.
+        self._mixer(spec).setvolume(max(0, min(100, int(spec.value))))
+
+    def _toggle_mute(self, spec):
+        mixer = self._mixer(spec)
+        if spec.action == "mic.toggle_mute":
+            mixer.setrec(0 if any(mixer.getrec()) else 1)
+        else:
+            mixer.setmute(0 if any(mixer.getmute()) else 1)
+
+    async def _close_router(self):
+        router, conn = self._router, self._conn
+        self._router = self._conn = None
+        if router is not None:
+            try:
+                await router.__aexit__(None, None, None)
+            finally:
+                await conn.close()
+
+    async def close(self):
+        await self._close_router()
+        for mixer in self._mixers.values():
+            mixer.close()
+        self._mixers.clear()
@@ -0,0 +1,254 @@
+import os
+import re
+import sys
+
+# rtmidi hängt an Portnamen oft "Client:Port"-Nummern an, die sich nach einem Neustart
+# oder Umstecken ändern können. Für den Vergleich mit dem gemerkten Port ignorieren wir sie.
+_PORT_NUMBERS = re.compile(r"\s+\d+:\d+$")
+
+
+def config_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
+    return os.path.join(base, "ko2-midi-commander")
+
+
+def last_port_path():
+    return os.path.join(config_dir(), "last_port")
+
+
+def load_last_ports():
+    # Eine Zeile pro Port, damit auch eine Auswahl mehrerer Eingänge gemerkt wird.
+    try:
+        with open(last_port_path(), encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def save_last_ports(names):
+    try:
+        os.makedirs(config_dir(), exist_ok=True)
+        with open(last_port_path(), "w", encoding="utf-8") as f:
+            f.write("".join(name + "\n" for name in names))
+    except OSError as e:
+        print(f"Port konnte nicht gespeichert werden: {e}")
+
+
+def base_name(name):
+    return _PORT_NUMBERS.sub("", name)
+
+
+def find_port(pattern, names):
+    # Reihenfolge: exakter Name, gleicher Name ohne Client:Port-Nummern, dann regulärer Ausdruck.
+    if pattern in names:
+        return pattern
+    base = base_name(pattern)
+    for name in names:
+        if base_name(name) == base:
+            return name
+    try:
+        regex = re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        regex = re.compile(re.escape(pattern), re.IGNORECASE)
+    for name in names:
+        if regex.search(name):
+            return name
+    return None
+
+
+def _rtmidi_backend():
+    return os.environ.get("MIDO_BACKEND", "mido.backends.rtmidi") == "mido.backends.rtmidi"
+
+
+def get_input_names():
+    # Mit dem Standard-Backend direkt über rtmidi (gleiche Namen wie mido): mido kostet beim
+    # Import rund 25 ms, den größten Teil davon mido.version über importlib.metadata.
+    if _rtmidi_backend():
+        try:
+            import rtmidi
+        except ImportError:
+            pass
+        else:
+            midi_in = rtmidi.MidiIn()
+            try:
+                return midi_in.get_ports()
+            finally:
+                midi_in.delete()
+    import mido
+    return mido.get_input_names()
+
+
+# Systemechtzeit-Statusbytes. Clock (24 pro Viertelnote, solange der Sequencer des KO II läuft)
+# filtert rtmidi selbst; nur Start, Continue und Stop werden als Nachricht weitergegeben.
+CLOCK = 0xF8
+TRANSPORT = {0xFA: "start", 0xFB: "continue", 0xFC: "stop"}
+
+
+class RtMidiInput:
+    # Eingang direkt über python-rtmidi statt über mido.open_input(). Clock, MTC, Active
+    # Sensing und SysEx verwirft schon rtmidi (ignore_types), ohne dass dafür Python-Code läuft.
+    # Mit clock (ko_tempo.TempoTracker) kommen Clock-Ticks durch und werden im rtmidi-Thread
+    # gezählt, ebenfalls ohne ein mido.Message zu bauen; Start, Continue und Stop setzen dort
+    # auch den Transportzustand, damit der nächste Tick schon richtig zählt. Liefert ein anderer
+    # Eingang die Clock (clock.claim), filtert rtmidi sie hier ab da wieder. Alles andere geht
+    # wie bei mido als Message an callback, mit raw als Liste der Bytes (Engine.raw_feeder).
+    def __init__(self, name, callback, clock=None, raw=False):
+        import rtmidi
+        self.name = name
+        self.callback = callback
+        self.clock = clock
+        if clock is not None:
+            clock.in_thread = True
+        self.closed = True
+        self.raw = raw
+        # mido erst beim ersten Bedarf; ko.py lädt es nach dem Start im Hintergrund vor.
+        self._from_bytes = None
+        self._rt = rtmidi.MidiIn()
+        names = self._rt.get_ports()
+        if name not in names:
+            self._rt.delete()
+            raise OSError(f"unbekannter MIDI-Input {name!r}")
+        self._rt.ignore_types(sysex=True, timing=clock is None, active_sense=True)
+        self._rt.set_callback(self._on_message)
+        try:
+            self._rt.open_port(names.index(name))
+        except RuntimeError as e:
+            self._rt.delete()
+            raise OSError(*e.args) from e
+        self.closed = False
+
+    def _on_message(self, event, data=None):
+        message = event[0]
+        status = message[0]
+        if status >= CLOCK:
+            clock = self.clock
+            if clock is not None and not clock.claim(self.name):
+                clock = self.clock = None
+                self._rt.ignore_types(sysex=True, timing=True, active_sense=True)
+            if status == CLOCK:
+                if clock is not None:
+                    clock.tick()
+            elif status in TRANSPORT:
+                if clock is not None:
+                    clock.transport(TRANSPORT[status])
+                self.callback(message if self.raw else self._message(message))
+            return
+        if status == 0xF1:
+            # MTC-Viertelbilder kommen mit timing=False ebenfalls durch.
+            return
+        if self.raw:
+            self.callback(message)
+            return
+        try:
+            msg = self._message(message)
+        except ValueError:
+            return
+        self.callback(msg)
+
+    def _message(self, data):
+        from_bytes = self._from_bytes
+        if from_bytes is None:
+            import mido
+            from_bytes = self._from_bytes = mido.Message.from_bytes
+        return from_bytes(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._rt.cancel_callback()
+        self._rt.close_port()
+        self._rt.delete()
+
+
+def open_input(name, callback=None, clock=None, raw=False):
+    # Ohne python-rtmidi oder mit einem anderen MIDO_BACKEND über mido wie bisher; dann kommen
+    # Clock- und Transport-Nachrichten als Message an und die Engine wertet sie aus (siehe
+    # Engine.dispatch).
+    if callback is not None and _rtmidi_backend():
+        try:
+            return RtMidiInput(name, callback, clock, raw)
+        except ImportError:
+            pass
+    import mido
+    if raw and callback is not None:
+        feed = callback
+        callback = lambda msg: feed(msg.bytes())
+    return mido.open_input(name, callback=callback)
+
+
+def get_output_names():
+    import mido
+    return mido.get_output_names()
+
+
+def open_output(name):
+    import mido
+    return mido.open_output(name)
+
+
+def resolve_output(pattern):
+    # Ausgang für die LED-Rückmeldung; fehlt er, läuft das Programm ohne LEDs weiter.
+    output_names = get_output_names()
+    port_name = find_port(pattern, output_names)
+    if port_name is None:
+        available = ", ".join(output_names) or "keine"
+        print(f"Kein MIDI-Output passt zu '{pattern}', LEDs bleiben aus. Verfügbar: {available}")
+    return port_name
+
+
+def print_no_inputs():
+    print("Keine MIDI-Inputs gefunden. Stelle sicher, dass der KO2 angeschlossen und erkannt wird.")
+    print("Möglicherweise müssen Sie `python-rtmidi` installieren, "
+          "wenn Sie dies noch nicht getan haben.")
+    print("Versuchen Sie: `pip install python-rtmidi`")
+
+
+def _unique(names):
+    return list(dict.fromkeys(names))
+
+
+def resolve_ports(patterns=(), interactive=True):
+    # Liefert die Liste der zu öffnenden Eingänge (leer = abbrechen). Jedes Muster wählt einen
+    # Port. Ohne Muster: im Terminal fragen (Enter = zuletzt genutzte Ports), sonst automatisch
+    # die zuletzt genutzten Ports nehmen, z.B. beim Autostart oder unter systemd.
+    input_names = get_input_names()
+    if not input_names:
+        print_no_inputs()
+        return []
+
+    if patterns:
+        port_names = []
+        for pattern in patterns:
+            port_name = find_port(pattern, input_names)
+            if port_name is None:
+                print(f"Kein MIDI-Input passt zu '{pattern}'. Verfügbar: {', '.join(input_names)}")
+                return []
+            port_names.append(port_name)
+        return _unique(port_names)
+
+    found = (find_port(last, input_names) for last in load_last_ports())
+    remembered = _unique(name for name in found if name is not None)
+    if not interactive:
+        if not remembered:
+            print("Kein Port angegeben (--port oder KO2_PORT) und kein gemerkter Port verfügbar.")
+        return remembered
+
+    print("Verfügbare MIDI-Inputs:")
+    for i, name in enumerate(input_names):
+        print(f"[{i}] {name}")
+
+    prompt = "Wähle Port-Index (mehrere mit Komma): "
+    if remembered:
+        prompt = f"Wähle Port-Index (mehrere mit Komma, Enter = {', '.join(remembered)}): "
+    try:
+        choice = input(prompt).strip()
+        if not choice and remembered:
+            return remembered
+        return _unique(input_names[int(i)] for i in choice.split(","))
+    except (ValueError, IndexError):
+        print("Ungültige Auswahl. Beende.")
+        return []
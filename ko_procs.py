@@ -0,0 +1,123 @@
+import asyncio
+import os
+
+PROC = "/proc"
+# Abstand der Vergleichsläufe über /proc; eigene Kinder werden zusätzlich sofort eingetragen
+# und beim Beenden (Kindprozess-Watcher) wieder entfernt.
+SCAN_INTERVAL = 2.0
+# comm ist im Kernel auf 15 Zeichen gekürzt.
+COMM_LENGTH = 15
+
+
+def read_names(pid):
+    # comm und Dateiname von exe, klein geschrieben; None, wenn der Prozess weg ist.
+    try:
+        with open(f"{PROC}/{pid}/comm", "rb") as f:
+            comm = f.read().rstrip(b"\n").decode(errors="replace").lower()
+    except OSError:
+        return None
+    try:
+        exe = os.path.basename(os.readlink(f"{PROC}/{pid}/exe")).lower()
+    except OSError:
+        # Prozesse anderer Benutzer: nur comm lesbar.
+        return (comm,)
+    exe = exe.removesuffix(" (deleted)")
+    return (comm,) if exe == comm else (comm, exe)
+
+
+def scan(known):
+    # Läuft in einem Thread: nur neue PIDs werden gelesen, verschwundene nur gemeldet.
+    current = {int(name) for name in os.listdir(PROC) if name.isdigit()}
+    added = {}
+    for pid in current - known:
+        names = read_names(pid)
+        if names is not None:
+            added[pid] = names
+    return added, known - current
+
+
+class ProcessIndex:
+    # Name -> PIDs aller laufenden Prozesse, damit single_instance ohne pgrep und ohne
+    # vollständigen Lauf über /proc auskommt: ein Treffer kostet einen Dict-Zugriff und eine
+    # Prüfung, ob die PID noch zum Namen passt (PIDs werden wiederverwendet).
+    def __init__(self, interval=SCAN_INTERVAL):
+        self.interval = interval
+        self.pids = {}
+        self.names = {}
+        self.scans = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._task = None
+
+    @staticmethod
+    def supported():
+        return os.path.isdir(f"{PROC}/self")
+
+    def stats(self):
+        return {"processes": len(self.pids), "scans": self.scans, "hits": self.hits,
+                "misses": self.misses, "stale": self.stale}
+
+    def start(self, loop):
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        loop = asyncio.get_running_loop()
+        added, gone = await loop.run_in_executor(None, scan, set(self.pids))
+        for pid in gone:
+            self.discard(pid)
+        for pid, names in added.items():
+            self._insert(pid, names)
+        self.scans += 1
+
+    def _insert(self, pid, names):
+        self.discard(pid)
+        self.pids[pid] = names
+        for name in names:
+            self.names.setdefault(name, set()).add(pid)
+
+    def add(self, pid):
+        # Eigenes Kind direkt nach exec(): sofort sichtbar, ohne auf den nächsten Lauf zu warten.
+        names = read_names(pid)
+        if names is not None:
+            self._insert(pid, names)
+
+    def discard(self, pid):
+        names = self.pids.pop(pid, None)
+        if names is None:
+            return
+        for name in names:
+            pids = self.names[name]
+            pids.discard(pid)
+            if not pids:
+                del self.names[name]
+
+    def find(self, names):
+        # Liefert eine laufende PID zu einem der Namen oder None.
+        for name in names:
+            for key in (name, name[:COMM_LENGTH]):
+                pids = self.names.get(key)
+                if not pids:
+                    continue
+                for pid in list(pids):
+                    current = read_names(pid)
+                    if current is not None and key in current:
+                        self.hits += 1
+                        return pid
+                    # Inzwischen beendet oder PID neu vergeben.
+                    self.stale += 1
+                    self.discard(pid)
+                    if current is not None:
+                        self._insert(pid, current)
+        self.misses += 1
+        return None
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,57 @@
+from array import array
+
+# Schneller Eingangspfad ohne mido (python ko.py --raw-midi): der rtmidi-Callback legt die Bytes
+# einer Nachricht als eine Ganzzahl
+#   länge << 24 | status << 16 | data1 << 8 | data2
+# in einen vorab angelegten Ringpuffer. Die Engine zerlegt sie mit Bitoperationen; ein
+# mido.Message entsteht nur für die seltenen Nachrichten, die kein Schnellpfad kennt.
+DEFAULT_RING_SIZE = 4096
+
+
+def pack(data):
+    n = len(data)
+    if n == 3:
+        return 3 << 24 | data[0] << 16 | data[1] << 8 | data[2]
+    if n == 2:
+        return 2 << 24 | data[0] << 16 | data[1] << 8
+    return n << 24 | data[0] << 16
+
+
+def unpack_message(packed):
+    import mido
+    data = (packed >> 16 & 0xFF, packed >> 8 & 0xFF, packed & 0xFF)
+    return mido.Message.from_bytes(data[:packed >> 24])
+
+
+class RawRing:
+    # Genau ein Schreiber (der rtmidi-Thread eines Eingangs) und ein Leser (die Event-Loop),
+    # daher ohne Lock: head schreibt nur put(), tail nur der Leser. Beide zählen nur hoch, der
+    # Platz ist zähler & mask. Ist der Puffer voll, wird verworfen und gezählt, statt zu warten.
+    # scheduled merkt, ob die Event-Loop schon geweckt ist: bei einem Burst reicht ein
+    # call_soon_threadsafe für alle Nachrichten, die bis zum Leeren eintreffen.
+    def __init__(self, size=DEFAULT_RING_SIZE):
+        size = 1 << max(size - 1, 1).bit_length()
+        self.mask = size - 1
+        self.events = array("I", [0]) * size
+        self.times = array("q", [0]) * size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.scheduled = False
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, data, t_ns):
+        head = self.head
+        if head - self.tail > self.mask:
+            self.dropped += 1
+            return False
+        if len(data) > 3:
+            # SysEx filtert rtmidi schon; über das mido-Backend ignorieren.
+            return False
+        i = head & self.mask
+        self.events[i] = pack(data)
+        self.times[i] = t_ns
+        self.head = head + 1
+        return True
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+
+from ko_dispatch import select_command
+from ko_latency import now_ns
+
+# Rahmen: 4 Byte Länge (big endian), danach kompaktes JSON. Anfragen und Antworten tragen eine
+# id, damit mehrere Anfragen unterwegs sein können (Pipelining) und Antworten in beliebiger
+# Reihenfolge zurückkommen dürfen:
+#   -> {"hello": 1, "token": "..."}           <- {"os": "linux"} oder {"error": "..."}
+#   -> {"id": 7, "cmd": "obs ...", "timeout": 10}
+#   <- {"id": 7, "pid": 1234}                 Prozess läuft
+#   <- {"id": 7, "rc": 0}                     Prozess beendet (oder {"id": 7, "error": "..."})
+HEADER = struct.Struct(">I")
+MAX_FRAME = 64 * 1024
+# Anfragen je Ziel, die während einer Unterbrechung gepuffert werden.
+DEFAULT_TARGET_QUEUE = 256
+# Ältere Tastendrücke werden nach dem Wiederverbinden nicht mehr ausgeführt.
+STALE_AFTER = 5.0
+BACKOFF_START = 0.25
+BACKOFF_FACTOR = 2.0
+BACKOFF_MAX = 5.0
+CONNECT_TIMEOUT = 2.0
+
+
+def encode_frame(message):
+    payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if size > MAX_FRAME:
+        raise ConnectionError(f"Rahmen zu groß ({size} Bytes)")
+    return json.loads(await reader.readexactly(size))
+
+
+def set_nodelay(writer):
+    # Kleine Rahmen sofort senden statt auf Nagle zu warten; sonst bis zu 40 ms Verzögerung.
+    sock = writer.get_extra_info("socket")
+    if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class AgentConnection:
+    # Eine dauerhafte Verbindung zu einem Agenten mit eigener Warteschlange. Ein Task verbindet
+    # (mit Backoff) und schreibt, einer liest die Antworten. Bricht die Verbindung ab, bleiben
+    # noch nicht gesendete Anfragen in der Warteschlange; bereits gesendete gelten als verloren,
+    # da nicht bekannt ist, ob der Agent sie noch ausgeführt hat (höchstens einmal).
+    def __init__(self, spec, engine, queue_size=DEFAULT_TARGET_QUEUE):
+        self.spec = spec
+        self.engine = engine
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.connected = False
+        self.remote_os = None
+        self.sent = 0
+        self.started = 0
+        self.failed = 0
+        self.dropped = 0
+        self.stale = 0
+        self.lost = 0
+        self.reconnects = 0
+        self._inflight = {}
+        self._next_id = 0
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stats(self):
+        return {"connected": self.connected, "queued": self.queue.qsize(), "inflight": len(self._inflight),
+                "sent": self.sent, "started": self.started, "failed": self.failed,
+                "dropped": self.dropped, "stale": self.stale, "lost": self.lost,
+                "reconnects": self.reconnects}
+
+    def submit(self, action, t_receive=None):
+        try:
+            self.queue.put_nowait((action, t_receive, time.monotonic()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            self.engine.log.message(f"⚠️ Warteschlange für {self.spec.name} voll, verwerfe: {action.name}")
+
+    async def _run(self):
+        backoff = None
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.spec.host, self.spec.port), CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError):
+                backoff = BACKOFF_START if backoff is None else min(backoff * BACKOFF_FACTOR, BACKOFF_MAX)
+                await asyncio.sleep(backoff)
+                continue
+            try:
+                await self._session(reader, writer)
+                backoff = None
+            except (OSError, ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+                    ValueError) as e:
+                if self.connected:
+                    self.engine.log.message(f"🔌 Verbindung zu {self.spec.name} verloren: {e}")
+                else:
+                    self.engine.log.message(f"Agent {self.spec.name} abgelehnt: {e}")
+                    backoff = BACKOFF_MAX
+            finally:
+                self.connected = False
+                writer.close()
+                self.lost += len(self._inflight)
+                self._inflight.clear()
+            await asyncio.sleep(backoff or BACKOFF_START)
+            self.reconnects += 1
+
+    async def _session(self, reader, writer):
+        set_nodelay(writer)
+        token = self.spec.token or os.environ.get("KO2_AGENT_TOKEN")
+        writer.write(encode_frame({"hello": 1, "token": token}))
+        reply = await asyncio.wait_for(read_frame(reader), CONNECT_TIMEOUT)
+        if "error" in reply:
+            raise ValueError(reply["error"])
+        self.remote_os = reply.get("os", "default")
+        self.connected = True
+        self.engine.log.message(f"🔗 Verbunden mit Agent {self.spec.name} "
+                                f"({self.spec.host}:{self.spec.port}, {self.remote_os})")
+        responses = asyncio.get_running_loop().create_task(self._read_responses(reader))
+        try:
+            while True:
+                getter = asyncio.ensure_future(self.queue.get())
+                done, _ = await asyncio.wait((getter, responses), return_when=asyncio.FIRST_COMPLETED)
+                if responses in done:
+                    getter.cancel()
+                    if getter.done() and not getter.cancelled():
+                        # Schon entnommen: zurücklegen, damit nichts verloren geht.
+                        self.queue.put_nowait(getter.result())
+                    responses.result()
+                    raise ConnectionError("Verbindung geschlossen")
+                # Alles, was schon wartet, in einem Schreibvorgang senden.
+                batch = [getter.result()]
+                while not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                writer.write(b"".join(self._request(*item) for item in batch))
+                await writer.drain()
+        finally:
+            responses.cancel()
+
+    def _request(self, action, t_receive, queued_at):
+        if time.monotonic() - queued_at > STALE_AFTER:
+            self.stale += 1
+            return b""
+        command = select_command(dict(action.target.commands), self.remote_os)
+        if not command:
+            self.failed += 1
+            self.engine.log.message(f"Kein Befehl für {self.spec.name} ({self.remote_os}): {action.name}")
+            return b""
+        self._next_id += 1
+        self._inflight[self._next_id] = (action, t_receive, now_ns())
+        self.sent += 1
+        return encode_frame({"id": self._next_id, "cmd": command, "timeout": action.timeout})
+
+    async def _read_responses(self, reader):
+        while True:
+            reply = await read_frame(reader)
+            entry = self._inflight.get(reply.get("id"))
+            if entry is None:
+                continue
+            action, t_receive, t_send = entry
+            if "pid" in reply:
+                t_started = now_ns()
+                self.started += 1
+                self.engine.remote_started(action, t_receive, t_started - t_send)
+                continue
+            del self._inflight[reply["id"]]
+            if "error" in reply:
+                self.failed += 1
+                self.engine.log.message(f"Fehler auf {self.spec.name} bei '{action.name}': {reply['error']}")
+            elif reply.get("rc"):
+                self.failed += 1
+                self.engine.log.message(f"Befehl auf {self.spec.name} '{action.name}' endete mit Code {reply['rc']}")
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class RemoteAgents:
+    # Verbindungen zu allen Agenten aus [targets]; beim Neuladen bleiben unveränderte bestehen.
+    def __init__(self, queue_size=DEFAULT_TARGET_QUEUE):
+        self.queue_size = queue_size
+        self.engine = None
+        self.connections = {}
+        self.unknown = 0
+
+    def stats(self):
+        return {name: conn.stats() for name, conn in self.connections.items()} or None
+
+    def bind(self, engine):
+        self.engine = engine
+
+    def configure(self, specs):
+        # Muss in der Event-Loop laufen; geschlossen wird im Hintergrund.
+        wanted = {spec.name: spec for spec in specs}
+        loop = asyncio.get_running_loop()
+        for name, conn in list(self.connections.items()):
+            if wanted.get(name) != conn.spec:
+                del self.connections[name]
+                loop.create_task(conn.close())
+        for name, spec in wanted.items():
+            if name not in self.connections:
+                self.connections[name] = AgentConnection(spec, self.engine, self.queue_size)
+
+    def submit(self, action, t_receive=None):
+        conn = self.connections.get(action.target.name)
+        if conn is None:
+            self.unknown += 1
+            self.engine.log.message(f"Unbekanntes Ziel {action.target.name!r} für {action.name}")
+            return
+        conn.submit(action, t_receive)
+
+    async def close(self):
+        connections, self.connections = self.connections, {}
+        for conn in connections.values():
+            await conn.close()
@@ -0,0 +1,76 @@
+import heapq
+
+from ko_dispatch import PRIORITIES
+from ko_latency import PERCENTILES, Histogram, now_ns
+
+# Gleichzeitige Starts (bis exec() im Kind gelungen ist), dazu Plätze nur für "critical".
+DEFAULT_SLOTS = 4
+RESERVED_SLOTS = 1
+RANK = {priority: rank for rank, priority in enumerate(PRIORITIES)}
+_CRITICAL = RANK["critical"]
+
+
+class Scheduler:
+    # Steht zwischen Dispatcher und Ausführung. Solange Plätze frei sind, startet jede Aktion
+    # sofort; sonst wartet sie in einem Heap nach (Priorität, Eingang). Ein Sperren des PCs oder
+    # Stummschalten überholt so eine Reihe wartender Programmstarts und hat mit den reservierten
+    # Plätzen auch dann einen Platz, wenn alle anderen gerade belegt sind.
+    def __init__(self, loop, launch, slots=DEFAULT_SLOTS, reserved=RESERVED_SLOTS):
+        self.loop = loop
+        self.launch = launch
+        self.slots = slots
+        self.reserved = reserved
+        self.running = 0
+        self.preempted = 0
+        self.waits = {priority: Histogram() for priority in PRIORITIES}
+        self._heap = []
+        self._seq = 0
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        return len(self._heap)
+
+    def stats(self):
+        return {
+            "pending": len(self._heap),
+            "running": self.running,
+            "preempted": self.preempted,
+            "wait": {priority: {f"p{p}": h.percentile(p) for p in PERCENTILES} | {"count": h.count, "max": h.max}
+                     for priority, h in self.waits.items() if h.count},
+        }
+
+    def _free(self, rank):
+        limit = self.slots + self.reserved if rank == _CRITICAL else self.slots
+        return self.running < limit
+
+    def submit(self, action, t_receive=None):
+        rank = RANK[action.priority]
+        if not self._heap and self._free(rank):
+            self._start(rank, action, t_receive, 0)
+            return
+        if self._heap and rank < self._heap[0][0]:
+            self.preempted += 1
+        self._seq += 1
+        heapq.heappush(self._heap, (rank, self._seq, action, t_receive, now_ns()))
+        self._pump()
+
+    def _pump(self):
+        heap = self._heap
+        while heap and self._free(heap[0][0]):
+            rank, _, action, t_receive, t_queued = heapq.heappop(heap)
+            self._start(rank, action, t_receive, now_ns() - t_queued)
+
+    def _start(self, rank, action, t_receive, waited):
+        self.waits[PRIORITIES[rank]].record(waited)
+        self.running += 1
+        task = self.loop.create_task(self._run(action, t_receive))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, action, t_receive):
+        try:
+            await self.launch(action, t_receive)
+        finally:
+            self.running -= 1
+            self._pump()
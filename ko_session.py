@@ -0,0 +1,170 @@
+import os
+import struct
+import sys
+import threading
+import time
+
+# Aufnahmeformat (little endian), nur anhängen, feste Satzlänge:
+#   Dateikopf:  b"KO2S" + Version (1 Byte) + 3 Byte reserviert
+#   Datensatz:  uint64 Zeit in ns seit Segmentbeginn, uint8 Länge, 3 Byte MIDI-Daten
+#               (ab Version 2: obere 4 Bit des Längenbytes = Nummer des Eingangs)
+# Jede Aufnahme beginnt ein neues Segment mit einem Marker-Satz (Länge 0xFF), dessen
+# Zeitfeld die Wanduhrzeit in ns enthält. Sysex passt nicht in 3 Byte und wird übersprungen.
+MAGIC = b"KO2S"
+VERSION = 2
+READABLE_VERSIONS = (1, 2)
+HEADER = MAGIC + bytes((VERSION, 0, 0, 0))
+RECORD = struct.Struct("<QB3s")
+SEGMENT_MARKER = 0xFF
+# So viele Sätze werden beim Abspielen auf einmal gelesen.
+READ_CHUNK = 4096
+
+
+class SessionRecorder:
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "ab")
+        if new:
+            self._file.write(HEADER)
+        elif check_header(path) != VERSION:
+            self._file.close()
+            raise ValueError(f"{path}: ältere Aufnahme, bitte in eine neue Datei aufzeichnen")
+        self._start = time.perf_counter_ns()
+        self._last_flush = self._start
+        self._file.write(RECORD.pack(time.time_ns(), SEGMENT_MARKER, b"\0\0\0"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, msg, port=0):
+        data = msg.bytes()
+        if len(data) > 3 or port > 15:
+            self.skipped += 1
+            return
+        now = time.perf_counter_ns()
+        with self._lock:
+            self._file.write(RECORD.pack(now - self._start, len(data) | port << 4, bytes(data)))
+            self.recorded += 1
+            if now - self._last_flush >= self.flush_interval * 1e9:
+                self._file.flush()
+                self._last_flush = now
+
+    def wrap(self, callback, port=0):
+        # Liefert einen Callback, der jede Nachricht aufzeichnet und dann weiterreicht.
+        def recording_callback(msg):
+            self.record(msg, port)
+            callback(msg)
+        return recording_callback
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def check_header(path):
+    with open(path, "rb") as f:
+        header = f.read(len(HEADER))
+    if header[:4] != MAGIC:
+        raise ValueError(f"{path} ist keine KO2-Sitzungsaufnahme")
+    if header[4] not in READABLE_VERSIONS:
+        raise ValueError(f"{path}: nicht unterstützte Version {header[4]}")
+    return header[4]
+
+
+def read_records(path):
+    # Liest die Datei stückweise, damit auch stundenlange Aufnahmen nicht in den Speicher müssen.
+    # Liefert (segment, ns, port, data); ns zählt ab dem Beginn des jeweiligen Segments.
+    check_header(path)
+    segment = -1
+    with open(path, "rb") as f:
+        f.seek(len(HEADER))
+        while True:
+            chunk = f.read(RECORD.size * READ_CHUNK)
+            if not chunk:
+                break
+            # Ein abgeschnittener letzter Satz (z.B. nach einem Absturz) wird ignoriert.
+            usable = len(chunk) - len(chunk) % RECORD.size
+            for ns, length, data in RECORD.iter_unpack(chunk[:usable]):
+                if length == SEGMENT_MARKER:
+                    segment += 1
+                    continue
+                yield segment, ns, length >> 4, data[:length & 0x0F]
+
+
+class ReplayInput:
+    # Ersatz für mido.open_input(name, callback=...): spielt eine Aufnahme in einem
+    # eigenen Thread ab. speed=1 in Echtzeit, speed=N N-fach schneller, speed=0 ohne Pausen.
+    # Nachrichten aller aufgezeichneten Eingänge kommen über den einen callback.
+    def __init__(self, path, callback=None, speed=1.0):
+        # Hier statt im Thread importieren: fehlt mido, scheitert schon der Start und nicht
+        # still der Abspiel-Thread (sonst wartet ko.py --replay endlos auf done).
+        import mido
+        self._from_bytes = mido.Message.from_bytes
+        self.name = path
+        self.path = path
+        self.callback = callback
+        self.speed = speed
+        self.sent = 0
+        self.done = threading.Event()
+        self._stop = False
+        # Wie mido.open_input(): der Port läuft ab dem Öffnen, nicht erst im with-Block.
+        self._thread = threading.Thread(target=self._run, name="session-replay", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._stop = True
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        callback = self.callback
+        speed = self.speed
+        current = None
+        base = 0
+        try:
+            for segment, ns, _, data in read_records(self.path):
+                if self._stop:
+                    break
+                if segment != current:
+                    # Pausen zwischen zwei Aufnahmen werden nicht nachgespielt.
+                    current = segment
+                    base = time.perf_counter_ns() - int(ns / speed) if speed > 0 else 0
+                if speed > 0:
+                    delay = base + int(ns / speed) - time.perf_counter_ns()
+                    if delay > 0:
+                        time.sleep(delay / 1e9)
+                callback(self._from_bytes(data))
+                self.sent += 1
+        finally:
+            self.done.set()
+
+
+def main(argv=None):
+    # python ko_session.py AUFNAHME.ko2s  ->  gibt alle Sätze lesbar aus
+    import mido
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("Verwendung: python ko_session.py AUFNAHME")
+        return 2
+    for segment, ns, port, data in read_records(argv[0]):
+        print(f"[{segment}] {ns / 1e6:12.3f}ms  #{port}  {mido.Message.from_bytes(data)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import secrets
+import signal
+
+from ko_log import SyncLog
+
+DEFAULT_POOL_SIZE = 2
+# Wie lange ein Job ohne eigenes timeout eine Shell belegen darf.
+DEFAULT_JOB_TIMEOUT = 30.0
+
+
+class CoprocessShell:
+    # Eine dauerhaft laufende /bin/sh, die Befehle über stdin bekommt. Nach jedem Befehl
+    # schreibt sie eine Endmarke mit Exit-Code auf stdout. Ausgaben der Befehle gehen auf
+    # stderr, damit sie im Terminal landen und das Protokoll nicht stören.
+    def __init__(self, index, pool=None):
+        self.index = index
+        self.pool = pool
+        self.proc = None
+        self.busy = False
+        self.seq = 0
+        self._marker = f"__KO2_DONE_{secrets.token_hex(8)}__"
+
+    @property
+    def alive(self):
+        return self.proc is not None and self.proc.returncode is None
+
+    async def ensure(self):
+        if self.alive:
+            return False
+        stderr = self.pool.child_output if self.pool is not None else None
+        self.proc = await asyncio.create_subprocess_exec(
+            "/bin/sh", stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=stderr, start_new_session=True)
+        return True
+
+    async def run(self, command, timeout):
+        self.seq += 1
+        seq = str(self.seq)
+        # Subshell: "exit", "cd" oder Variablen eines Befehls erreichen die Coprocess-Shell nicht.
+        # </dev/null: der Befehl darf die nachfolgenden Jobs nicht von stdin lesen.
+        job = (f"( {command}\n) </dev/null 1>&2\n"
+               f"printf '%s %s %s\\n' {self._marker} {seq} $?\n")
+        self.proc.stdin.write(job.encode())
+        await self.proc.stdin.drain()
+        return await asyncio.wait_for(self._read_result(seq), timeout)
+
+    async def _read_result(self, seq):
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise ConnectionError("Shell unerwartet beendet")
+            parts = line.decode(errors="replace").split()
+            if len(parts) == 3 and parts[0] == self._marker and parts[1] == seq:
+                return int(parts[2])
+
+    async def kill(self):
+        if not self.alive:
+            return
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await self.proc.wait()
+
+
+class ShellPool:
+    # Hält einige Shells warm, damit kleine Befehle (amixer, dbus-send, echo) ohne
+    # eigenen /bin/sh-Start laufen. Ist keine Shell frei, liefert submit() False und
+    # der Aufrufer startet den Befehl wie gewohnt als eigenen Prozess.
+    def __init__(self, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_JOB_TIMEOUT):
+        self.shells = [CoprocessShell(i, self) for i in range(size)]
+        self.timeout = timeout
+        # Wie Supervisor.child_output: wohin die Ausgaben der Befehle gehen.
+        self.child_output = None
+        # Wie Supervisor.log.
+        self.log = SyncLog()
+        self.jobs = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.respawns = 0
+        self.fallbacks = 0
+        self._tasks = set()
+
+    @staticmethod
+    def supported():
+        return os.name == "posix" and os.path.exists("/bin/sh")
+
+    def stats(self):
+        return {
+            "shells": sum(1 for s in self.shells if s.alive),
+            "busy": sum(1 for s in self.shells if s.busy),
+            "jobs": self.jobs,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "respawns": self.respawns,
+            "fallbacks": self.fallbacks,
+        }
+
+    def submit(self, action):
+        for shell in self.shells:
+            if not shell.busy:
+                break
+        else:
+            self.fallbacks += 1
+            return False
+        shell.busy = True
+        task = asyncio.get_running_loop().create_task(self._run(shell, action))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, shell, action):
+        timeout = action.timeout if action.timeout is not None else self.timeout
+        try:
+            started = await shell.ensure()
+            if started and shell.seq:
+                self.respawns += 1
+            self.jobs += 1
+            rc = await shell.run(action.command, timeout)
+            if rc != 0:
+                self.failed += 1
+                self.log.message(f"Befehl '{action.command}' endete mit Code {rc}")
+        except asyncio.TimeoutError:
+            # Der hängende Befehl läuft in der Prozessgruppe der Shell: alles beenden,
+            # beim nächsten Job wird eine frische Shell gestartet.
+            self.timed_out += 1
+            self.log.message(f"⏱️ Zeitüberschreitung nach {timeout}s, beende: {action.name}")
+            await shell.kill()
+        except (ConnectionError, BrokenPipeError, ConnectionResetError) as e:
+            self.failed += 1
+            self.log.message(f"Fehler bei der Befehlsausführung '{action.command}': {e}")
+            await shell.kill()
+        finally:
+            shell.busy = False
+
+    async def close(self, timeout=1.0):
+        # Laufende Jobs kurz abschließen lassen: ein Abbruch mitten im Start einer Shell
+        # kann asyncio beim Beenden hängen lassen.
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+        for shell in self.shells:
+            if shell.alive:
+                shell.proc.stdin.close()
+                try:
+                    await asyncio.wait_for(shell.proc.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    await shell.kill()
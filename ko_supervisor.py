@@ -0,0 +1,153 @@
+import asyncio
+import os
+import signal
+import sys
+
+from ko_log import SyncLog
+
+DEFAULT_MAX_CHILDREN = 64
+DEFAULT_MAX_PER_ACTION = 8
+# Wartezeit zwischen SIGTERM und SIGKILL bei Zeitüberschreitung.
+KILL_GRACE = 2.0
+
+
+def install_child_watcher():
+    # Ab Python 3.12 nutzt asyncio pidfd von selbst. Davor startet der Standard-Watcher
+    # einen Thread pro Kindprozess; mit pidfd wird stattdessen im Event-Loop abgeräumt.
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+    except OSError:
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    asyncio.set_child_watcher(watcher)
+
+
+class Supervisor:
+    def __init__(self, max_children=DEFAULT_MAX_CHILDREN, max_per_action=DEFAULT_MAX_PER_ACTION,
+                 timeout=None):
+        self.max_children = max_children
+        self.max_per_action = max_per_action
+        self.timeout = timeout
+        self.live = 0
+        self.live_per_note = {}
+        self.started = 0
+        self.finished = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # on_change(note) nach jeder Änderung von live_per_note, z.B. für die LED-Rückmeldung.
+        self.on_change = None
+        # Ziel für stdout/stderr der Kinder (Dateideskriptor), None = Terminal erben.
+        self.child_output = None
+        # ko_procs.ProcessIndex: Kinder werden beim Start ein- und beim Beenden ausgetragen.
+        self.processes = None
+        # Meldungen (Fehler, Zeitüberschreitungen) gehen über das Protokoll der Engine.
+        self.log = SyncLog()
+        self._watchers = set()
+
+    def stats(self):
+        return {
+            "live": self.live,
+            "started": self.started,
+            "finished": self.finished,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def _limit_reason(self, action):
+        # "critical" (Sperren, Stummschalten) zählt nicht gegen das globale Limit, sonst wäre
+        # der reservierte Platz im Scheduler (ko_scheduler.py) hier wieder verloren.
+        if (self.max_children is not None and self.live >= self.max_children
+                and action.priority != "critical"):
+            return f"globales Limit von {self.max_children} Prozessen erreicht"
+        limit = action.max_instances if action.max_instances is not None else self.max_per_action
+        if limit is not None and self.live_per_note.get(action.note, 0) >= limit:
+            return f"Limit von {limit} gleichzeitigen Prozessen für diese Taste erreicht"
+        return None
+
+    def _acquire(self, note):
+        self.live += 1
+        self.live_per_note[note] = self.live_per_note.get(note, 0) + 1
+        if self.on_change is not None:
+            self.on_change(note)
+
+    def _release(self, note):
+        self.live -= 1
+        count = self.live_per_note[note] - 1
+        if count:
+            self.live_per_note[note] = count
+        else:
+            del self.live_per_note[note]
+        if self.on_change is not None:
+            self.on_change(note)
+
+    async def spawn(self, action):
+        reason = self._limit_reason(action)
+        if reason is not None:
+            self.rejected += 1
+            self.log.message(f"Übersprungen: {action.name} ({reason})")
+            return None
+        # Platz vor dem await reservieren, damit parallele Starts das Limit nicht überholen.
+        self._acquire(action.note)
+        try:
+            proc = await self._create(action)
+        except Exception as e:
+            self._release(action.note)
+            self.failed += 1
+            self.log.message(f"Fehler bei der Befehlsausführung '{action.command}': {e}")
+            return None
+        self.started += 1
+        if self.processes is not None:
+            self.processes.add(proc.pid)
+        task = asyncio.get_running_loop().create_task(self._watch(action, proc))
+        self._watchers.add(task)
+        task.add_done_callback(self._watchers.discard)
+        return proc
+
+    async def _create(self, action):
+        # Eigene Session: Strg+C im Terminal trifft die gestarteten Programme nicht mit,
+        # und bei Zeitüberschreitung lässt sich die ganze Prozessgruppe beenden.
+        kwargs = {"start_new_session": True} if os.name == "posix" else {}
+        if self.child_output is not None:
+            kwargs["stdout"] = kwargs["stderr"] = self.child_output
+        if action.shell:
+            return await asyncio.create_subprocess_shell(action.argv, **kwargs)
+        return await asyncio.create_subprocess_exec(*action.argv, **kwargs)
+
+    async def _watch(self, action, proc):
+        timeout = action.timeout if action.timeout is not None else self.timeout
+        try:
+            if timeout is None:
+                await proc.wait()
+            else:
+                try:
+                    await asyncio.wait_for(proc.wait(), timeout)
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    self.log.message(f"⏱️ Zeitüberschreitung nach {timeout}s, beende: {action.name}")
+                    await self._kill(proc)
+        finally:
+            if self.processes is not None:
+                self.processes.discard(proc.pid)
+            self._release(action.note)
+            self.finished += 1
+
+    async def _kill(self, proc):
+        self._signal(proc, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(proc.wait(), KILL_GRACE)
+        except asyncio.TimeoutError:
+            self._signal(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+            await proc.wait()
+
+    def _signal(self, proc, sig):
+        try:
+            if os.name == "posix":
+                os.killpg(proc.pid, sig)
+            else:
+                proc.send_signal(sig)
+        except ProcessLookupError:
+            pass
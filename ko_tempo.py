@@ -0,0 +1,102 @@
+import threading
+import time
+
+# MIDI-Clock: 24 Ticks pro Viertelnote.
+TICKS_PER_BEAT = 24
+DEFAULT_BEATS_PER_BAR = 4
+# Gleitender Mittelwert über etwa einen Schlag; größere Lücken gelten als Aussetzer.
+SMOOTHING = 1.0 / TICKS_PER_BEAT
+MAX_TICK_NS = 250_000_000
+
+
+class TempoTracker:
+    # Leitet Tempo und Position aus MIDI-Clock ab. tick() läuft im rtmidi-Thread (siehe
+    # ko_ports.RtMidiInput) und kostet pro Tick nur ein paar Ganzzahl- und Gleitkomma-
+    # operationen, ohne ein Message-Objekt. Nur tick() schreibt ticks und interval_ns;
+    # transport() setzt lediglich Merker, die der nächste Tick übernimmt. Mit in_thread läuft auch
+    # transport() im rtmidi-Thread, in derselben Reihenfolge wie die Ticks; sonst (mido-Backend,
+    # Aufnahmen) ruft die Engine beides auf. Gezählt wird nur die Clock eines Eingangs (source):
+    # mit --clock-port fest gewählt, sonst der erste, der Clock oder Transport schickt (claim()).
+    def __init__(self, beats_per_bar=DEFAULT_BEATS_PER_BAR):
+        self.beats_per_bar = beats_per_bar
+        self.source = None
+        self.claimed = False
+        self._claim_lock = threading.Lock()
+        self.running = False
+        self.ticks = 0
+        self.total_ticks = 0
+        self.interval_ns = None
+        self.last_ns = None
+        self.starts = 0
+        self.stops = 0
+        self.in_thread = False
+        self._reset = False
+
+    def accepts(self, source):
+        return not self.claimed or self.source == source
+
+    def claim(self, source):
+        # Wird aus mehreren rtmidi-Threads aufgerufen; das Lock braucht nur der allererste Aufruf.
+        if not self.claimed:
+            with self._claim_lock:
+                if not self.claimed:
+                    self.source = source
+                    self.claimed = True
+        return self.source == source
+
+    @property
+    def bpm(self):
+        interval = self.interval_ns
+        return 60e9 / (interval * TICKS_PER_BEAT) if interval else None
+
+    def stats(self):
+        bpm = self.bpm
+        return {"running": self.running, "bpm": round(bpm, 1) if bpm else None,
+                "beat": self.ticks // TICKS_PER_BEAT, "ticks": self.total_ticks,
+                "starts": self.starts, "stops": self.stops, "source": self.source}
+
+    def tick(self, t_ns=None):
+        t_ns = time.perf_counter_ns() if t_ns is None else t_ns
+        if self._reset:
+            self._reset = False
+            self.ticks = 0
+        else:
+            self.ticks += 1
+        self.total_ticks += 1
+        last, self.last_ns = self.last_ns, t_ns
+        if last is None:
+            return
+        interval = t_ns - last
+        if not 0 < interval < MAX_TICK_NS:
+            return
+        if self.interval_ns is None:
+            self.interval_ns = interval
+        else:
+            self.interval_ns += (interval - self.interval_ns) * SMOOTHING
+
+    def transport(self, kind):
+        # start: der nächste Tick ist Schlag 1 von Takt 1; continue läuft an der Position weiter.
+        if kind == "start":
+            self._reset = True
+        if kind == "stop":
+            self.running = False
+            self.stops += 1
+        else:
+            self.running = True
+            self.starts += 1
+
+    def delay_to(self, unit):
+        # Sekunden bis zum nächsten Schlag bzw. Takt; 0, solange der Sequencer steht oder noch
+        # kein Tempo bekannt ist (dann wird sofort ausgeführt).
+        interval = self.interval_ns
+        if not self.running or interval is None or self.last_ns is None:
+            return 0.0
+        period = TICKS_PER_BEAT * (self.beats_per_bar if unit == "bar" else 1)
+        if self._reset:
+            # Start empfangen, der erste Tick (die Eins) steht noch aus.
+            return 0.0
+        # ticks ist der Index des letzten Ticks seit Start, 0 = Schlag 1 von Takt 1.
+        position = self.ticks
+        target = (position // period + 1) * period
+        delay_ns = (target - position) * interval - (time.perf_counter_ns() - self.last_ns)
+        return max(0.0, delay_ns / 1e9)
@@ -0,0 +1,210 @@
+import asyncio
+import codecs
+import os
+import sys
+import threading
+
+from rich.segment import Segment
+from textual.app import App
+from textual.containers import Grid
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.widgets import Footer, Header, Static
+
+# So viele Logzeilen bleiben im Speicher, ältere werden überschrieben.
+DEFAULT_LOG_LINES = 5000
+# Bildwiederholrate der Oberfläche, unabhängig davon, wie schnell MIDI-Nachrichten kommen.
+DEFAULT_FPS = 15
+
+
+class LogBuffer:
+    # Ringpuffer fester Größe für Logzeilen. Ersetzt sys.stdout, solange die Oberfläche läuft:
+    # ein print() kostet dann nur das Ablegen der Zeile, gezeichnet wird im festen Takt.
+    def __init__(self, size=DEFAULT_LOG_LINES):
+        self.size = size
+        self.total = 0
+        self._lines = [""] * size
+        self._partial = ""
+        # print() im Event-Loop und der Log-Thread (ko_log.EventLog) schreiben gleichzeitig.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, self.size)
+
+    def __getitem__(self, index):
+        # 0 ist die älteste noch gehaltene Zeile.
+        return self._lines[(self.total - len(self) + index) % self.size]
+
+    @property
+    def dropped(self):
+        return self.total - len(self)
+
+    def append(self, line):
+        self._lines[self.total % self.size] = line
+        self.total += 1
+
+    def write(self, text):
+        with self._lock:
+            *lines, self._partial = (self._partial + text).split("\n")
+            for line in lines:
+                self.append(line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class OutputFile:
+    # Ausgaben der gestarteten Programme landen im Log statt quer über der Oberfläche. Sie gehen
+    # in eine Datei, aus der die Oberfläche im Takt nachliest. Eine Pipe ginge nicht: Programme,
+    # die länger laufen als die Oberfläche, bekämen danach beim nächsten Schreiben SIGPIPE.
+    def __init__(self, buffer, path=None, fps=DEFAULT_FPS):
+        self.buffer = buffer
+        self.path = default_output_path() if path is None else path
+        self.interval = 1 / fps
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # O_APPEND: Kinder aus einem früheren Lauf schreiben weiter ans Ende, ohne zu überschreiben.
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+        self._reader = open(self.path, "rb")
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._task = None
+
+    def start(self, loop):
+        self._task = loop.create_task(self._poll())
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self._read()
+
+    def _read(self):
+        data = self._reader.read()
+        if data:
+            self.buffer.write(self._decoder.decode(data))
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._read()
+        self._reader.close()
+        # Die Kinder haben eigene Kopien des Deskriptors und schreiben weiter in die Datei.
+        os.close(self.fd)
+
+
+def default_output_path():
+    from ko_mapping import default_cache_dir
+    return os.path.join(default_cache_dir(), "tui-output.log")
+
+
+class LogView(ScrollView):
+    # Zeichnet nur die sichtbaren Zeilen des Ringpuffers (Line-API). Neue Zeilen werden im
+    # Takt von fps übernommen; steht die Ansicht unten, folgt sie dem Ende.
+    DEFAULT_CSS = """
+    LogView {
+        height: 1fr;
+    }
+    """
+
+    def __init__(self, buffer, fps=DEFAULT_FPS, **kwargs):
+        super().__init__(**kwargs)
+        self.buffer = buffer
+        self.fps = fps
+        self._shown = -1
+        self._dropped = 0
+
+    def on_mount(self):
+        self.set_interval(1 / self.fps, self._tick)
+
+    def _tick(self):
+        buffer = self.buffer
+        if buffer.total == self._shown:
+            return
+        follow = self.scroll_offset.y >= self.max_scroll_y
+        shift = buffer.dropped - self._dropped
+        self._shown = buffer.total
+        self._dropped = buffer.dropped
+        self.virtual_size = Size(self.scrollable_content_region.width, len(buffer))
+        if follow:
+            self.scroll_end(animate=False, immediate=True)
+        elif shift:
+            # Beim Zurückblättern bleibt die gelesene Stelle stehen, auch wenn vorne Zeilen wegfallen.
+            self.scroll_to(y=max(0, self.scroll_offset.y - shift), animate=False, immediate=True)
+        self.refresh()
+
+    def render_line(self, y):
+        width = self.scrollable_content_region.width
+        index = self.scroll_offset.y + y
+        if index >= len(self.buffer):
+            return Strip.blank(width, self.rich_style)
+        strip = Strip([Segment(self.buffer[index], self.rich_style)])
+        return strip.crop_extend(0, width, self.rich_style)
+
+
+class CommanderApp(App):
+    CSS_PATH = "ko.css"
+    TITLE = "KO2 MIDI Commander"
+    BINDINGS = [
+        ("q", "quit", "Beenden"),
+        ("l", "latency", "Latenzen"),
+        ("s", "stats", "Statistik"),
+    ]
+
+    def __init__(self, engine, port_names, buffer, fps=DEFAULT_FPS):
+        super().__init__()
+        self.engine = engine
+        self.port_names = port_names
+        self.buffer = buffer
+        self.fps = fps
+
+    def compose(self):
+        yield Header()
+        with Grid(id="app-grid"):
+            yield Static("🎛️  KO2 MIDI Commander", id="title")
+            yield Static("MIDI-Eingänge:", id="port-list-label")
+            yield Static("\n".join(self.port_names), id="selected-port-label")
+            yield LogView(self.buffer, self.fps, id="log-display")
+            yield Static("Drücke eine Taste am KO2 ...  q = Beenden, l = Latenzen, s = Statistik",
+                         id="instruction-footer")
+        yield Footer()
+
+    def on_mount(self):
+        # Textual leitet stdout während des Laufs selbst um; print() soll aber in den Log.
+        sys.stdout = sys.stderr = self.buffer
+        self.set_interval(0.5, self._update_counters)
+
+    def _update_counters(self):
+        engine = self.engine
+        self.sub_title = (f"{engine.received} empfangen · {engine.dispatched} gestartet · "
+                          f"{engine.dropped} verworfen")
+
+    def action_latency(self):
+        print(self.engine.latency.report())
+
+    def action_stats(self):
+        stats = self.engine.stats()
+        children = stats["children"]
+        print(f"Queue: Tiefe {stats['queue_depth']} (max. {stats['max_depth']}), "
+              f"verworfen {stats['dropped']}, gestartet {stats['dispatched']}; "
+              f"Prozesse: {children['live']} laufend, {children['finished']} beendet; "
+              f"Log: {self.buffer.dropped} alte Zeilen verworfen")
+
+
+async def run(engine, port_names, buffer, fps=DEFAULT_FPS):
+    # Läuft, bis die Oberfläche beendet wird; der Dispatcher teilt sich die Event-Loop mit ihr.
+    loop = asyncio.get_running_loop()
+    output = OutputFile(buffer, fps=fps)
+    output.start(loop)
+    engine.supervisor.child_output = output.fd
+    if engine.shell_pool is not None:
+        engine.shell_pool.child_output = output.fd
+    runner = loop.create_task(engine.run())
+    try:
+        await CommanderApp(engine, port_names, buffer, fps).run_async()
+    finally:
+        runner.cancel()
+        output.close()